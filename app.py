@@ -7,18 +7,31 @@ AV Monitor - 新着チェック Web アプリ
 編集モードでグループ管理が可能。
 """
 
+import hashlib
 import re
 import uuid
 import streamlit as st
-import requests
 import gspread
 import pandas as pd
 import urllib.parse
-import feedparser
-import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable
 from streamlit_sortables import sort_items
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from oauth2client.service_account import ServiceAccountCredentials
 from filters import filter_items
+from fetch_pool import HostRateLimiter, fan_out
+from http_cache import HttpCache
+from local_store import ACTRESS_COLUMNS, LocalStore, SheetSync
+from dmm_client import DmmClient, group_items_by_actress
+from cache_warmer import CacheWarmer, build_refreshers
+from feed_snapshot import (
+    DEFAULT_PATH as DEFAULT_SNAPSHOT_PATH,
+    fetch_snapshot, fresh_entries, load_snapshot, resolve_pickup, top_k_latest,
+)
+from nh_blog import DEFAULT_CONCURRENCY, DEFAULT_FEED_TIMEOUT, NhBlog
 
 # ---------------------------------------------------------------------------
 # ページ設定 & カスタムCSS (ブラック × ピンク テーマ)
@@ -385,6 +398,7 @@ for key, default in {
     "add_success": "",
     "edit_mode": False,
     "pending_names": "",        # 検索待ち名前テキスト
+    "open_groups": set(),       # 遅延読み込みモードで開いているグループ
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
@@ -418,46 +432,96 @@ def get_sheet(tab_name: str):
     return client.open("fanza_db").worksheet(tab_name)
 
 
+def secret_flag(name: str, default: bool = False) -> bool:
+    """真偽値の secrets を読む。"1" / "true" / "yes" (大小文字無視) だけを True とする
+    (bool("false") が True になるのを避ける)。"""
+    return str(st.secrets.get(name, default)).strip().lower() in ("1", "true", "yes")
+
+
+# ---------------------------------------------------------------------------
+# 並列フェッチ設定
+# ---------------------------------------------------------------------------
+FETCH_WORKERS = int(st.secrets.get("fetch_workers", 8))
+FETCH_RATE_PER_SEC = float(st.secrets.get("fetch_rate_per_sec", 5))
+# 0 より大きい場合、直近 N 日のフロア全体スイープで個別取得を省略する
+DMM_SWEEP_DAYS = int(st.secrets.get("dmm_sweep_days", 0))
+# true にするとグループの作品は開いたときに取得する (遅延読み込みモード)。
+# ピックアップ (FANZA) は直近 LAZY_PICKUP_DAYS 日のスイープ 1 回で作る
+LAZY_GROUPS = secret_flag("lazy_groups")
+LAZY_PICKUP_DAYS = DMM_SWEEP_DAYS or 30
+# 通知スクリプトが書き出すスナップショット。これより古い女優はライブ取得で補う
+# feed_snapshot_url (専用ブランチの raw URL) があればそちらを、無ければローカルの
+# ファイルを読む
+FEED_SNAPSHOT_URL = st.secrets.get("feed_snapshot_url", "")
+FEED_SNAPSHOT_PATH = st.secrets.get("feed_snapshot_path", DEFAULT_SNAPSHOT_PATH)
+SNAPSHOT_MAX_AGE = timedelta(hours=float(st.secrets.get("snapshot_max_age_hours", 26)))
+
+
+@st.cache_resource
+def _get_rate_limiter() -> HostRateLimiter:
+    """ホスト単位のレートリミッタ。全セッションで共有する。"""
+    return HostRateLimiter(FETCH_RATE_PER_SEC)
+
+
+def run_parallel(jobs):
+    """fan_out で (キー, 関数) のジョブを並列実行する。
+    ワーカースレッドからも st.cache_data を使えるようにコンテキストを引き継ぐ。
+    レートリミットは DmmClient / NhBlog が実際に通信するときだけかかるので、
+    キャッシュで済む再実行は待たされない。"""
+    script_ctx = get_script_run_ctx()
+    return fan_out(
+        jobs,
+        workers=FETCH_WORKERS,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx),
+    )
+
+
 # ---------------------------------------------------------------------------
 # DMM API ヘルパー
 # ---------------------------------------------------------------------------
 API_ID = st.secrets["api_id"]
 AFFILIATE_ID = st.secrets["affiliate_id"]
-DMM_ITEM_ENDPOINT = "https://api.dmm.com/affiliate/v3/ItemList"
-DMM_ACTRESS_ENDPOINT = "https://api.dmm.com/affiliate/v3/ActressSearch"
 
 
-def search_actress_api(keyword: str, hits: int = 10):
-    params = {
-        "api_id": API_ID,
-        "affiliate_id": AFFILIATE_ID,
-        "keyword": keyword,
-        "hits": hits,
-        "output": "json",
-    }
-    resp = requests.get(DMM_ACTRESS_ENDPOINT, params=params, timeout=15)
-    resp.raise_for_status()
-    return resp.json().get("result", {}).get("actress", [])
+@st.cache_resource
+def _get_http_cache() -> HttpCache:
+    """再起動をまたいで使う永続 HTTP キャッシュ (SQLite)。"""
+    return HttpCache()
+
+
+@st.cache_resource
+def _get_dmm_client() -> DmmClient:
+    """keep-alive セッションを全セッション・全ワーカーで共有する。"""
+    return DmmClient(
+        API_ID, AFFILIATE_ID,
+        pool_size=max(FETCH_WORKERS, 10), cache=_get_http_cache(),
+        limiter=_get_rate_limiter(),
+    )
+
+
+def search_actress_api(keyword: str, hits: int = 10, *, refresh: bool = False):
+    """ActressSearch (結果は永続キャッシュに 24 時間保存)。"""
+    return _get_dmm_client().search_actresses(keyword, hits=hits, refresh=refresh)
 
 
 @st.cache_data(ttl=600, show_spinner=False)
 def search_items_by_actress(actress_id: str, hits: int = 30):
     """API検索結果を10分間キャッシュ。ページリロードでも再取得しない。"""
-    params = {
-        "api_id": API_ID,
-        "affiliate_id": AFFILIATE_ID,
-        "site": "FANZA",
-        "service": "mono",
-        "floor": "dvd",
-        "article": "actress",
-        "article_id": actress_id,
-        "hits": hits,
-        "sort": "date",
-        "output": "json",
-    }
-    resp = requests.get(DMM_ITEM_ENDPOINT, params=params, timeout=15)
-    resp.raise_for_status()
-    return resp.json().get("result", {}).get("items", [])
+    return _get_dmm_client().search_items_by_actress(actress_id, hits=hits)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_feed_snapshot() -> dict:
+    """通知スクリプトが書き出したスナップショット (5 分ごとに読み直す)。"""
+    if FEED_SNAPSHOT_URL:
+        return fetch_snapshot(FEED_SNAPSHOT_URL)
+    return load_snapshot(FEED_SNAPSHOT_PATH)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def sweep_recent_items(gte_date: str) -> list[dict]:
+    """フロア全体の gte_date 以降の作品を一括取得 (10分キャッシュ)。"""
+    return _get_dmm_client().sweep_items(gte_date=gte_date)
 
 
 def make_item_url(content_id: str) -> str:
@@ -468,260 +532,137 @@ def make_item_url(content_id: str) -> str:
 
 
 # ---------------------------------------------------------------------------
-# NHブログ スクレイピングヘルパー
+# NHブログ ヘルパー (実体は nh_blog.py)
 # ---------------------------------------------------------------------------
-NH_BLOG_BASE = "https://main.av-somurie.xyz"
-NH_BLOG_SEARCH_URL = NH_BLOG_BASE + "/?s={query}&feed=rss2"
-NH_BLOG_UA = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/120.0.0.0 Safari/537.36"
-)
-
+NH_FEED_TIMEOUT = float(st.secrets.get("nh_feed_timeout", DEFAULT_FEED_TIMEOUT))
+NH_CONCURRENCY = int(st.secrets.get("nh_concurrency", DEFAULT_CONCURRENCY))
 
-def _nh_get(url: str) -> str:
-    """User-Agent 付きで GET し、HTMLテキストを返す。"""
-    resp = requests.get(url, headers={"User-Agent": NH_BLOG_UA}, timeout=60)
-    resp.raise_for_status()
-    return resp.text
 
-
-def _fetch_rss(url: str) -> feedparser.FeedParserDict:
-    """User-Agent 付きで RSS を取得し feedparser でパースして返す。"""
-    resp = requests.get(url, headers={"User-Agent": NH_BLOG_UA}, timeout=30)
-    resp.raise_for_status()
-    return feedparser.parse(resp.content)
+@st.cache_resource
+def _get_nh_blog() -> NhBlog:
+    return NhBlog(
+        _get_http_cache(), feed_timeout=NH_FEED_TIMEOUT, concurrency=NH_CONCURRENCY,
+        limiter=_get_rate_limiter(),
+    )
 
 
-def search_nh_blog(actress_name: str) -> dict:
+def search_nh_blog(actress_name: str, *, refresh: bool = False) -> dict:
     """NHブログを検索し、女優のカテゴリパス・記事数を返す。
     戻り値: {category_path, articles: [{title, link, published}], count}
     category_path が空の場合は該当なし。"""
-    url = NH_BLOG_SEARCH_URL.format(query=urllib.parse.quote(actress_name))
-    feed = _fetch_rss(url)
-
-    # 記事リンクからカテゴリパスを逆算
-    # 例: https://main.av-somurie.xyz/tagyou/takanashi_kanon/post-57648/
-    #   → category_path = "tagyou/takanashi_kanon"
-    category_path = ""
-    articles = []
-    for entry in feed.entries:
-        link = entry.get("link", "")
-        title = entry.get("title", "")
-        published = entry.get("published", "")
-        # /actress_search/ は女優一覧ページなので除外
-        if "/actress_search/" in link:
-            continue
-        
-        # 記事リンクからカテゴリパスを抽出
-        # 例: https://main.av-somurie.xyz/tagyou/takanashi_kanon/post-57648/
-        m = re.match(r"https?://main\.av-somurie\.xyz/([\w]+/[\w]+)/post-\d+/?", link)
-        if m:
-            path = m.group(1)
-            # URLのパスに、検索した女優名のローマ字読みなどが入っているか完全な一致判定は難しいが、
-            # tagyou/takanashi_kanon のようなパスになっているはず。
-            # 他の女優(nanami等)の単なる共演記事であればカテゴリパスが異なる。
-            # よって最初の記事のカテゴリパスをその女優の専用カテゴリパスと見なす。
-            # もしRSSの「カテゴリー」タグ等の情報で判別できるならそれが最善だが、
-            # 現状は1番目に見つかった実際のカテゴリパスを信じて、それ以外は弾く。
-            if not category_path:
-                category_path = path
-
-            # カテゴリパスが最初に確定したものと一致する記事だけを採用（別女優のカテゴリ記事を除外）
-            if path == category_path:
-                articles.append({
-                    "title": title,
-                    "link": link,
-                    "published": published,
-                })
-
-    # さらに厳密に、取得した articles が本当にその女優向けか検証が必要なら行うが、
-    # 基本的に名前検索でトップに出てくる一番多いカテゴリを採用するロジックにする
-    if articles:
-        # カテゴリ一覧の抽出とカウント
-        path_counts = {}
-        for entry in feed.entries:
-            link = entry.get("link", "")
-            if "/actress_search/" in link: continue
-            m = re.match(r"https?://main\.av-somurie\.xyz/([\w]+/[\w]+)/post-\d+/?", link)
-            if m:
-                p = m.group(1)
-                path_counts[p] = path_counts.get(p, 0) + 1
-                
-        # 一番出現頻度が高いカテゴリパスを正解とする
-        if path_counts:
-            best_path = max(path_counts, key=path_counts.get)
-            category_path = best_path
-            
-            # best_path の記事だけ再収集
-            articles = []
-            for entry in feed.entries:
-                link = entry.get("link", "")
-                title = entry.get("title", "")
-                published = entry.get("published", "")
-                m = re.match(r"https?://main\.av-somurie\.xyz/([\w]+/[\w]+)/post-\d+/?", link)
-                if m and m.group(1) == best_path:
-                    articles.append({
-                        "title": title,
-                        "link": link,
-                        "published": published,
-                    })
-
-    return {
-        "category_path": category_path,
-        "articles": articles,
-        "count": len(articles),
-    }
+    return _get_nh_blog().search(actress_name, refresh=refresh)
+
+
+def _scrape_nh_face_img(category_path: str, *, refresh: bool = False) -> str:
+    """カテゴリページHTMLから顔画像URLのみを取得する (7 日間キャッシュ)。"""
+    return _get_nh_blog().scrape_face_img(category_path, refresh=refresh)
 
 
-def _scrape_nh_face_img(category_path: str) -> str:
-    """カテゴリページHTMLから顔画像URLのみを取得する。"""
-    cat_url = f"{NH_BLOG_BASE}/category/{category_path}/"
-    html = _nh_get(cat_url)
-    profile_m = re.search(
-        r'<article[^>]*class=["\'][^"\']*category-content[^"\']*["\'][^>]*>(.*?)</article>',
-        html, re.DOTALL,
+def fetch_nh_blog_items_many(category_paths: list[str], max_items: int = 5) -> dict[str, list[dict]]:
+    """複数カテゴリの RSS を asyncio で並行取得する (ダッシュボード用)。
+    失敗・タイムアウトしたカテゴリは空リスト。RSS 本文は永続キャッシュ、
+    パース結果は本文が変わるまでプロセス内で再利用される。"""
+    results, _errors = _get_nh_blog().category_items_many(category_paths, max_items)
+    return {p: results.get(p, []) for p in category_paths}
+
+
+# ---------------------------------------------------------------------------
+# キャッシュウォーマー (サーバープロセスごとに 1 つ)
+# ---------------------------------------------------------------------------
+# 期限切れ間近の DMM / NH のキャッシュを裏で取り直し、ページを開いた人が
+# 上流 API を待たないようにする。レートリミッタはクライアント経由で閲覧者と共有する。
+CACHE_WARMER_ENABLED = secret_flag("cache_warmer", True)
+
+
+@st.cache_resource
+def _start_cache_warmer() -> CacheWarmer:
+    warmer = CacheWarmer(
+        _get_http_cache(),
+        build_refreshers(_get_dmm_client(), _get_nh_blog()),
     )
-    if profile_m:
-        img_m = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', profile_m.group(1))
-        if img_m:
-            return img_m.group(1)
-    return ""
-
-
-def _fetch_nh_category_rss(category_path: str, max_items: int = 5) -> list[dict]:
-    """カテゴリ RSS から最新作品を取得する（軽量・高速）。
-    戻り値: [{title, link, thumbnail, published}]"""
-    rss_url = f"{NH_BLOG_BASE}/category/{category_path}/?feed=rss2"
-    feed = _fetch_rss(rss_url)
-    works = []
-    for entry in feed.entries[:max_items]:
-        title = entry.get("title", "")
-        link = entry.get("link", "")
-        
-        # 投稿日時を FANZA と同じ YYYY-MM-DD HH:MM:SS 形式に揃える
-        published_parsed = entry.get("published_parsed")
-        if published_parsed:
-            published = time.strftime('%Y-%m-%d %H:%M:%S', published_parsed)
-        else:
-            published = entry.get("published", "")
-
-        # content:encoded や summary から画像を抽出
-        content = ""
-        if "content" in entry and entry.content:
-            content = entry.content[0].get("value", "")
-        if not content:
-            content = entry.get("summary", "")
-            
-        imgs = re.findall(r'<img[^>]+src=["\']([^"\']+)["\']', content)
-        
-        thumb = ""
-        # 1. pl.(jpg|webp|png) や top.jpg (パッケージ画像) を優先的に探す
-        for img in imgs:
-            if re.search(r'(?:pl|top)\.(?:jpg|jpeg|png|webp)', img, re.IGNORECASE):
-                thumb = img
-                break
-                
-        # 2. なければ、サンプル画像 (jp-X.jpg, -X.jpg, _X.jpg) および バナー画像 以外を探す
-        if not thumb:
-            for img in imgs:
-                if not re.search(r'(?:jp-\d+|-\d+|_\d+)\.(?:jpg|jpeg|png|webp)|bannar', img, re.IGNORECASE):
-                    thumb = img
-                    break
-                    
-        # 3. それでもなければ最初の画像
-        if not thumb and imgs:
-            thumb = imgs[0]
-
-        if title:
-            works.append({
-                "title": title,
-                "link": link,
-                "thumbnail": thumb,
-                "published": published,
-            })
-    return works
-
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def fetch_nh_blog_items(category_path: str, max_items: int = 5) -> list[dict]:
-    """NHブログ カテゴリRSS から最新作品を取得（1 時間キャッシュ）。
-    戻り値: [{title, link, thumbnail, published}]
-    例外時はキャッシュせず次回リトライ可能。"""
-    return _fetch_nh_category_rss(category_path, max_items)
+    warmer.start()
+    return warmer
+
+
+if CACHE_WARMER_ENABLED:
+    _start_cache_warmer()
 
 
 # ---------------------------------------------------------------------------
-# スプシ操作ヘルパー
+# スプシ操作ヘルパー (ローカルストア経由)
 # ---------------------------------------------------------------------------
+# 読み取りはローカル SQLite から行い、書き込みは SheetSync が
+# バックグラウンドでスプレッドシートへ反映する (write-behind)。
+STORE_REFRESH_SEC = 300
+
+
+@st.cache_resource
+def _get_local_store() -> LocalStore:
+    return LocalStore()
+
+
+@st.cache_resource
+def _get_sheet_sync() -> SheetSync:
+    return SheetSync(_get_local_store(), get_sheet, tabs=("actresses",)).start()
+
+
+def _hydrate_actresses(store: LocalStore):
+    """スプレッドシートの actresses タブをローカルストアに取り込む。"""
+    ws = get_sheet("actresses")
+    store.hydrate("actresses", ws.get_all_records())
+    # ヘッダーが ACTRESS_COLUMNS の並びでなければ (source 列がない・列が
+    # 入れ替わっているなど)、取り込んだ内容でヘッダーごと書き直す
+    if ws.row_values(1) != ACTRESS_COLUMNS:
+        store.request_rewrite("actresses")
+        _get_sheet_sync().notify()
+
+
 def get_all_actresses(force_refresh: bool = False) -> pd.DataFrame:
     if not force_refresh and "df_actresses_cache" in st.session_state:
         return st.session_state.df_actresses_cache
-    ws = get_sheet("actresses")
-    # ヘッダーに source 列がなければ自動追加
-    header = ws.row_values(1)
-    if "source" not in header:
-        ws.update_cell(1, len(header) + 1, "source")
-    records = ws.get_all_records()
-    if not records:
-        df = pd.DataFrame(columns=["name", "actress_id", "image_url", "group", "source"])
-    else:
-        df = pd.DataFrame(records)
-        if "group" not in df.columns:
-            df["group"] = ""
-        df["group"] = df["group"].fillna("").astype(str)
-        # source 列のフォールバック: 空欄は FANZA として扱う
-        if "source" not in df.columns:
-            df["source"] = "FANZA"
-        df["source"] = df["source"].fillna("").astype(str)
-        df["source"] = df["source"].replace("", "FANZA")
+    store = _get_local_store()
+    _get_sheet_sync()  # 前回プロセスの未送信分もここから反映される
+    # 未送信の変更がある間はローカルが正なので取り込み直さない
+    if not store.has_pending("actresses") and (
+        force_refresh or store.is_stale("actresses", STORE_REFRESH_SEC)
+    ):
+        _hydrate_actresses(store)
+    df = pd.DataFrame(store.actresses(), columns=ACTRESS_COLUMNS)
     st.session_state.df_actresses_cache = df
     return df
 
 
 def _invalidate_actress_cache():
     st.session_state.pop("df_actresses_cache", None)
-    _get_gspread_client.clear()
+    _get_sheet_sync().notify()
 
 
 def add_actresses_batch(actress_list: list[tuple[str, str, str, str]]):
     """actress_list: [(name, actress_id, image_url, source), ...]"""
-    ws = get_sheet("actresses")
     rows = [[name, str(aid), img, "", source] for name, aid, img, source in actress_list]
-    ws.append_rows(rows)
+    _get_local_store().append_actresses(rows)
     _invalidate_actress_cache()
 
 
 def delete_actress(actress_id: str):
-    ws = get_sheet("actresses")
-    records = ws.get_all_records()
-    for i, r in enumerate(records, start=2):
-        if str(r.get("actress_id")) == str(actress_id):
-            ws.delete_rows(i)
-            break
+    _get_local_store().delete_actress(actress_id)
     _invalidate_actress_cache()
 
 
 def _rebuild_sheet(df: pd.DataFrame):
-    ws = get_sheet("actresses")
-    ws.clear()
-    ws.append_row(["name", "actress_id", "image_url", "group", "source"])
+    rows = []
     if not df.empty:
-        cols = ["name", "actress_id", "image_url", "group", "source"]
-        for c in cols:
+        for c in ACTRESS_COLUMNS:
             if c not in df.columns:
                 df[c] = "FANZA" if c == "source" else ""
-        rows = df[cols].values.tolist()
-        ws.append_rows(rows)
+        rows = df[ACTRESS_COLUMNS].values.tolist()
+    _get_local_store().replace_actresses(rows)
     _invalidate_actress_cache()
 
 
 def save_actress_order(ordered_groups: list[dict]):
-    ws = get_sheet("actresses")
-    records = ws.get_all_records()
-    id_map = {}
-    for r in records:
-        id_map[str(r.get("actress_id", ""))] = r
+    store = _get_local_store()
+    id_map = {r["actress_id"]: r for r in store.actresses()}
 
     new_rows = []
     for container in ordered_groups:
@@ -731,19 +672,11 @@ def save_actress_order(ordered_groups: list[dict]):
             aid = label.rsplit("[", 1)[-1].rstrip("]").strip()
             if aid in id_map:
                 r = id_map[aid]
-                src = str(r.get("source", "")) or "FANZA"
                 new_rows.append([
-                    r.get("name", ""),
-                    str(r.get("actress_id", "")),
-                    r.get("image_url", ""),
-                    actual_group,
-                    src,
+                    r["name"], r["actress_id"], r["image_url"], actual_group, r["source"],
                 ])
 
-    ws.clear()
-    ws.append_row(["name", "actress_id", "image_url", "group", "source"])
-    if new_rows:
-        ws.append_rows(new_rows)
+    store.replace_actresses(new_rows)
     _invalidate_actress_cache()
 
 
@@ -790,6 +723,14 @@ def _cb_batch_add():
             st.session_state.search_error = f"追加失敗: {e}"
 
 
+def _cb_toggle_group(group: str):
+    """遅延読み込みモードのグループ開閉状態を記録する。"""
+    if st.session_state.get(f"group_open_{group}"):
+        st.session_state.open_groups.add(group)
+    else:
+        st.session_state.open_groups.discard(group)
+
+
 def _cb_swap(df, idx_a, idx_b):
     swap_actress_order(df, idx_a, idx_b)
     search_items_by_actress.clear()
@@ -817,59 +758,116 @@ def render_actress_header(name: str, image_url: str):
     )
 
 
-def render_hscroll(items: list[dict]):
-    if not items:
-        st.caption("新作なし")
-        return
-
-    cards = []
-    for item in items:
-        title = item.get("title", "タイトル不明")
-        date = item.get("date", "")[:10]
-        cid = item.get("content_id", "")
-        url = make_item_url(cid) if cid else "#"
-        img = (
-            item.get("imageURL", {}).get("large", "")
-            or item.get("imageURL", {}).get("small", "")
-        )
+# ---------------------------------------------------------------------------
+# カード HTML (作品の並びが同じなら前回の文字列を再利用)
+# ---------------------------------------------------------------------------
+# Streamlit はクリックのたびにスクリプト全体を再実行するため、
+# 横スクロール 1 本分の HTML を (種別, 女優ID, カードの表示項目のハッシュ) の
+# キーで保持しておき、表示内容の変わった女優・ピックアップだけを組み立て直す。
+# ハッシュにはリンク・画像・タイトル・日付行 (女優名を含む) をすべて含めるので、
+# DMM 側でタイトルや画像が差し替わった作品も新しい内容で表示される。
+CARD_HTML_CACHE_MAX = 2048
+
+
+@st.cache_resource
+def _get_card_html_cache() -> tuple[OrderedDict, threading.Lock]:
+    return OrderedDict(), threading.Lock()
+
+
+def cached_hscroll_html(
+    scope: tuple, cards: Iterable[tuple[str, str, str, str]]
+) -> str:
+    """カードの並びに対応する横スクロールの HTML を返す。
+    同じ scope・同じ表示項目の HTML があれば再利用し、無ければ組み立てて保存する。"""
+    cards = list(cards)
+    digest = hashlib.blake2b(digest_size=16)
+    for card in cards:
+        digest.update("\x1f".join(map(str, card)).encode("utf-8"))
+        digest.update(b"\x1e")
+    key = (scope, digest.digest())
+
+    cache, lock = _get_card_html_cache()
+    with lock:
+        html = cache.get(key)
+        if html is not None:
+            cache.move_to_end(key)
+            return html
+
+    html = hscroll_html(cards)
+
+    with lock:
+        cache[key] = html
+        if len(cache) > CARD_HTML_CACHE_MAX:
+            cache.popitem(last=False)
+    return html
+
+
+def hscroll_html(cards: Iterable[tuple[str, str, str, str]]) -> str:
+    """(リンク, 画像URL, タイトル, 日付行) の並びから横スクロールの HTML を返す。"""
+    parts = []
+    for url, img, title, dt in cards:
         img_tag = f'<img src="{img}" loading="lazy">' if img else ""
-        cards.append(
+        parts.append(
             f'<a class="icard" href="{url}" target="_blank">'
             f"  {img_tag}"
             f'  <div class="ttl">{title}</div>'
-            f'  <div class="dt">📅 {date}</div>'
+            f'  <div class="dt">{dt}</div>'
             f"</a>"
         )
+    return '<div class="hscroll">' + "".join(parts) + "</div>"
+
+
+def _date_line(date: str, actress_name: str = "") -> str:
+    if actress_name:
+        return f"📅 {date}　👤 {actress_name}"
+    return f"📅 {date}"
+
+
+def fanza_card(item: dict, actress_name: str = "") -> tuple[str, str, str, str]:
+    cid = item.get("content_id", "")
+    img = (
+        item.get("imageURL", {}).get("large", "")
+        or item.get("imageURL", {}).get("small", "")
+    )
+    return (
+        make_item_url(cid) if cid else "#",
+        img,
+        item.get("title", "タイトル不明"),
+        _date_line(item.get("date", "")[:10], actress_name),
+    )
+
+
+def blog_card(
+    title: str, link: str, thumbnail: str, date: str, actress_name: str = ""
+) -> tuple[str, str, str, str]:
+    return (link, thumbnail, title, _date_line(date[:10], actress_name))
+
+
+def render_hscroll(items: list[dict], actress_id: str = ""):
+    if not items:
+        st.caption("新作なし")
+        return
 
     st.markdown(
-        '<div class="hscroll">' + "".join(cards) + "</div>",
+        cached_hscroll_html(("fanza", actress_id), (fanza_card(item) for item in items)),
         unsafe_allow_html=True,
     )
 
 
-def render_hscroll_blog(items: list[dict]):
+def render_hscroll_blog(items: list[dict], actress_id: str = ""):
     """NHブログ作品をカード型で横スクロール表示する。"""
     if not items:
         st.caption("作品なし")
         return
 
-    cards = []
-    for item in items:
-        title = item.get("title", "タイトル不明")
-        url = item.get("link", "#")
-        thumb = item.get("thumbnail", "")
-        date = item.get("published", "")[:10]
-        img_tag = f'<img src="{thumb}" loading="lazy">' if thumb else ""
-        cards.append(
-            f'<a class="icard" href="{url}" target="_blank">'
-            f"  {img_tag}"
-            f'  <div class="ttl">{title}</div>'
-            f'  <div class="dt">📅 {date}</div>'
-            f"</a>"
-        )
-
     st.markdown(
-        '<div class="hscroll">' + "".join(cards) + "</div>",
+        cached_hscroll_html(("blog", actress_id), (
+            blog_card(
+                item.get("title", "タイトル不明"), item.get("link", "#"),
+                item.get("thumbnail", ""), item.get("published", ""),
+            )
+            for item in items
+        )),
         unsafe_allow_html=True,
     )
 
@@ -903,55 +901,70 @@ with st.sidebar:
             placeholder="深田えいみ, 三上悠亜, 橋本ありな",
             height=80,
         )
+        refresh_search = st.checkbox(
+            "キャッシュを使わずに検索", value=False,
+            help="保存済みの検索結果・顔画像を捨てて取り直します。",
+        )
         submitted = st.form_submit_button("検索", use_container_width=True)
 
     if submitted and query:
         names = parse_names(query)
         if search_source == "FANZA公式":
-            # --- FANZA 検索 (既存ロジック) ---
+            # --- FANZA 検索 (既存ロジック、名前ごとに並列) ---
             old_results = dict(st.session_state.search_results)
+            # キャッシュを使わない場合は表示中の名前も検索し直す
+            targets = [n for n in names if refresh_search or n not in old_results]
+            found_map, error_map = run_parallel(
+                (name, lambda n=name: search_actress_api(n, hits=5, refresh=refresh_search))
+                for name in targets
+            )
             errors = []
-            for name in names:
-                if name in old_results:
-                    continue
-                try:
-                    found = search_actress_api(name, hits=5)
-                    if found:
-                        old_results[name] = found
-                    else:
-                        errors.append(f"「{name}」: 見つかりません")
-                except Exception as e:
-                    errors.append(f"「{name}」: {e}")
+            for name in targets:
+                if name in error_map:
+                    errors.append(f"「{name}」: {error_map[name]}")
+                elif found_map.get(name):
+                    old_results[name] = found_map[name]
+                else:
+                    old_results.pop(name, None)
+                    errors.append(f"「{name}」: 見つかりません")
             st.session_state.search_results = old_results
             if errors:
                 st.session_state.search_error = " / ".join(errors)
         else:
-            # --- NH検索 (プレビュー→選択方式) ---
+            # --- NH検索 (プレビュー→選択方式、名前ごとに並列) ---
+            def _lookup_nh(name: str) -> dict | None:
+                result = search_nh_blog(name, refresh=refresh_search)
+                cat_path = result.get("category_path", "")
+                articles = result.get("articles", [])
+                if not (cat_path and articles):
+                    return None
+                # カテゴリページから顔画像を取得
+                try:
+                    face_img = _scrape_nh_face_img(cat_path, refresh=refresh_search)
+                except Exception:
+                    face_img = ""
+                return {
+                    "category_path": cat_path,
+                    "articles": articles,
+                    "face_img": face_img,
+                    "count": len(articles),
+                }
+
             old_nh = dict(st.session_state.nh_search_results)
+            targets = [n for n in names if refresh_search or n not in old_nh]
+            found_map, error_map = run_parallel(
+                (name, lambda n=name: _lookup_nh(n))
+                for name in targets
+            )
             errors = []
-            for name in names:
-                if name in old_nh:
-                    continue
-                try:
-                    result = search_nh_blog(name)
-                    cat_path = result.get("category_path", "")
-                    articles = result.get("articles", [])
-                    if cat_path and articles:
-                        # カテゴリページから顔画像を取得
-                        try:
-                            face_img = _scrape_nh_face_img(cat_path)
-                        except Exception:
-                            face_img = ""
-                        old_nh[name] = {
-                            "category_path": cat_path,
-                            "articles": articles,
-                            "face_img": face_img,
-                            "count": len(articles),
-                        }
-                    else:
-                        errors.append(f"「{name}」: 記事が見つかりません")
-                except Exception as e:
-                    errors.append(f"「{name}」: {e}")
+            for name in targets:
+                if name in error_map:
+                    errors.append(f"「{name}」: {error_map[name]}")
+                elif found_map.get(name):
+                    old_nh[name] = found_map[name]
+                else:
+                    old_nh.pop(name, None)
+                    errors.append(f"「{name}」: 記事が見つかりません")
             st.session_state.nh_search_results = old_nh
             if errors:
                 st.session_state.search_error = " / ".join(errors)
@@ -1159,11 +1172,8 @@ else:
         if st.button("💾 グループ順を保存", use_container_width=True, type="primary"):
             # グループ順序を反映させて全データ書き直し
             new_order = st.session_state.edit_group_order
-            ws = get_sheet("actresses")
-            records = ws.get_all_records()
-            id_map = {}
-            for r in records:
-                id_map[str(r.get("actress_id", ""))] = r
+            store = _get_local_store()
+            id_map = {r["actress_id"]: r for r in store.actresses()}
 
             new_rows = []
             for gname in new_order:
@@ -1172,19 +1182,11 @@ else:
                     aid = str(m["row"]["actress_id"])
                     if aid in id_map:
                         ir = id_map[aid]
-                        src = str(ir.get("source", "")) or "FANZA"
                         new_rows.append([
-                            ir.get("name", ""),
-                            str(ir.get("actress_id", "")),
-                            ir.get("image_url", ""),
-                            actual_g,
-                            src,
+                            ir["name"], ir["actress_id"], ir["image_url"], actual_g, ir["source"],
                         ])
 
-            ws.clear()
-            ws.append_row(["name", "actress_id", "image_url", "group", "source"])
-            if new_rows:
-                ws.append_rows(new_rows)
+            store.replace_actresses(new_rows)
             _invalidate_actress_cache()
             st.session_state.pop("edit_group_order", None)
             st.success("グループ順を保存しました！")
@@ -1288,11 +1290,7 @@ else:
                         extras.remove(del_group)
                     else:
                         with st.spinner("削除中…"):
-                            ws = get_sheet("actresses")
-                            records = ws.get_all_records()
-                            for i, r in enumerate(records, start=2):
-                                if str(r.get("group", "")) == del_group:
-                                    ws.update_cell(i, 4, "")
+                            _get_local_store().clear_group(del_group)
                             _invalidate_actress_cache()
                     st.success(
                         f"「{del_group}」を削除しました。"
@@ -1339,77 +1337,114 @@ else:
     else:
         st.session_state.pop("extra_groups", None)
 
-        # --- 全女優のデータを1回で取得＆フィルタ (高速化) ---
-        filtered_cache: dict[str, list[dict]] = {}      # FANZA 用
-        blog_cache: dict[str, list[dict]] = {}            # NHブログ用
-        for g in group_order:
-            for member in groups[g]:
-                actress_id = str(member["row"]["actress_id"]).replace(".0", "").strip()
-                source = str(member["row"].get("source", "")) or "FANZA"
+        # --- 全女優のデータを並列で取得＆フィルタ (高速化) ---
+        def _fetch_fanza(aid: str) -> list[dict]:
+            raw = search_items_by_actress(aid, hits=30)
+            return filter_items(raw, require_sample_video=True)
+
+        def _member_key(member: dict) -> tuple[str, str]:
+            row = member["row"]
+            return (
+                str(row.get("source", "")) or "FANZA",
+                str(row["actress_id"]).replace(".0", "").strip(),
+            )
+
+        def _load_members(members: list[dict]) -> None:
+            """members のうち未取得の女優を並列取得して filtered_cache / blog_cache に入れる。"""
+            jobs = []
+            nh_paths: list[str] = []
+            for member in members:
+                source, actress_id = _member_key(member)
                 if source == "NH_BLOG":
                     if actress_id not in blog_cache:
-                        try:
-                            blog_cache[actress_id] = fetch_nh_blog_items(actress_id)
-                        except Exception:
-                            blog_cache[actress_id] = []
-                else:
-                    if actress_id not in filtered_cache:
-                        try:
-                            raw = search_items_by_actress(actress_id, hits=30)
-                            filtered_cache[actress_id] = filter_items(
-                                raw, require_sample_video=True,
-                            )
-                        except Exception:
-                            filtered_cache[actress_id] = []
-                            
+                        nh_paths.append(actress_id)
+                elif actress_id not in filtered_cache:
+                    jobs.append((
+                        ("FANZA", actress_id), lambda aid=actress_id: _fetch_fanza(aid),
+                    ))
+
+            # NHブログは 1 ジョブ内で asyncio により全フィードを並行取得し、
+            # FANZA の取得と重ねて待ち時間を隠す
+            if nh_paths:
+                jobs.append((
+                    ("NH_BLOG_ALL", ""), lambda: fetch_nh_blog_items_many(nh_paths),
+                ))
+
+            fetched, _errors = run_parallel(jobs)
+            # 失敗した女優は空リスト扱い (他の女優には影響させない)
+            for path in nh_paths:
+                blog_cache[path] = []
+            blog_cache.update(fetched.get(("NH_BLOG_ALL", ""), {}))
+            for (source, actress_id), _fn in jobs:
+                if source == "FANZA":
+                    filtered_cache[actress_id] = fetched.get((source, actress_id), [])
+
+        all_members = [m for g in group_order for m in groups[g]]
+        fanza_ids = [aid for src, aid in map(_member_key, all_members) if src != "NH_BLOG"]
+
+        # 通知スクリプトが書いたスナップショットのうち新しいものはそのまま使い、
+        # 古い・欠けている女優だけをライブ取得で補う
+        snapshot = load_feed_snapshot()
+        snapshot_items = fresh_entries(snapshot, SNAPSHOT_MAX_AGE)
+        filtered_cache: dict[str, list[dict]] = {   # FANZA 用
+            aid: snapshot_items[aid] for aid in fanza_ids if aid in snapshot_items
+        }
+        blog_cache: dict[str, list[dict]] = {}      # NHブログ用
+        missing_ids = [aid for aid in fanza_ids if aid not in filtered_cache]
+
+        # 日付窓スイープだけで新作が表示件数分そろう女優は個別取得を省略する。
+        # 遅延読み込みモードではスイープ結果をそのままピックアップにも使う
+        sweep_days = LAZY_PICKUP_DAYS if LAZY_GROUPS else DMM_SWEEP_DAYS
+        swept_all: dict[str, list[dict]] = {}
+        if sweep_days > 0 and missing_ids:
+            try:
+                gte = (datetime.now() - timedelta(days=sweep_days)).strftime("%Y-%m-%d")
+                grouped = group_items_by_actress(sweep_recent_items(gte), missing_ids)
+                for aid, raw in grouped.items():
+                    kept = filter_items(raw, require_sample_video=True)
+                    swept_all[aid] = kept
+                    if len(kept) >= MAX_ITEMS_PER_ACTRESS:
+                        filtered_cache[aid] = kept
+            except Exception:
+                swept_all = {}
+
+        if LAZY_GROUPS:
+            # ピックアップに必要な分だけ先に用意し、グループの中身は開いたときに取得
+            _load_members([m for m in all_members if _member_key(m)[0] == "NH_BLOG"])
+            pickup_fanza = {**swept_all, **filtered_cache}
+        else:
+            _load_members(all_members)
+            pickup_fanza = filtered_cache
+
         # --- 🔥 新着ピックアップ (全女優から最新10本) ---
-        all_latest: list[dict] = []
-        nh_latest: list[dict] = []
-        for g in group_order:
-            for member in groups[g]:
-                actress = member["row"]
-                actress_id = str(actress["actress_id"]).replace(".0", "").strip()
-                source = str(actress.get("source", "")) or "FANZA"
-                if source == "NH_BLOG":
-                    for it in blog_cache.get(actress_id, []):
-                        entry = {
-                            "title": it.get("title", ""),
-                            "date": it.get("published", ""),
-                            "content_id": "",
-                            "_link": it.get("link", ""),
-                            "_thumbnail": it.get("thumbnail", ""),
-                            "_actress_name": actress["name"],
-                            "_source": "NH_BLOG",
-                        }
-                        nh_latest.append(entry)
-                else:
-                    for it in filtered_cache.get(actress_id, []):
-                        entry = {**it, "_actress_name": actress["name"], "_source": "FANZA"}
-                        all_latest.append(entry)
-
-        # FANZA の新着ソートと重複除去
-        all_latest.sort(key=lambda x: x.get("date", ""), reverse=True)
-        seen_keys: set[str] = set()
-        unique_latest: list[dict] = []
-        for it in all_latest:
-            key = it.get("content_id", "")
-            if key and key not in seen_keys:
-                seen_keys.add(key)
-                unique_latest.append(it)
-            if len(unique_latest) >= 10:
-                break
-                
-        # NH の新着ソートと重複除去 (投稿日ベース)
-        nh_latest.sort(key=lambda x: x.get("date", ""), reverse=True)
-        seen_nh_keys: set[str] = set()
-        unique_nh_latest: list[dict] = []
-        for it in nh_latest:
-            key = it.get("_link", "")
-            if key and key not in seen_nh_keys:
-                seen_nh_keys.add(key)
-                unique_nh_latest.append(it)
-            if len(unique_nh_latest) >= 10:
-                break
+        # 女優ごとの新しい順リストを k-way マージし、重複を除いて 10 件で打ち切る
+        fanza_sources: list[tuple[str, list[dict]]] = []
+        nh_sources: list[tuple[str, list[dict]]] = []
+        for member in all_members:
+            source, actress_id = _member_key(member)
+            name = member["row"]["name"]
+            if source == "NH_BLOG":
+                nh_sources.append((name, blog_cache.get(actress_id, [])))
+            else:
+                fanza_sources.append((name, pickup_fanza.get(actress_id, [])))
+
+        # FANZA は content_id、NH はリンクで重複除去 (NH は投稿日ベース)
+        # スナップショットが全員分そろっていれば保存済みのピックアップを使う
+        names_by_id = {_member_key(m)[1]: m["row"]["name"] for m in all_members}
+        stored_pickup = resolve_pickup(snapshot, snapshot_items, fanza_ids)
+        if stored_pickup is not None:
+            unique_latest = [(it, names_by_id[aid]) for it, aid in stored_pickup]
+        else:
+            unique_latest = top_k_latest(
+                fanza_sources,
+                date_of=lambda it: it.get("date", ""),
+                id_of=lambda it: it.get("content_id", ""),
+            )
+        unique_nh_latest = top_k_latest(
+            nh_sources,
+            date_of=lambda it: it.get("published", ""),
+            id_of=lambda it: it.get("link", ""),
+        )
 
         if unique_latest:
             st.markdown(
@@ -1418,27 +1453,11 @@ else:
                 unsafe_allow_html=True,
             )
             st.caption("登録女優の最新作品")
-            cards = []
-            for item in unique_latest:
-                title = item.get("title", "タイトル不明")
-                aname = item.get("_actress_name", "")
-                date = item.get("date", "")[:10]
-                cid = item.get("content_id", "")
-                url = make_item_url(cid) if cid else "#"
-                img = (
-                    item.get("imageURL", {}).get("large", "")
-                    or item.get("imageURL", {}).get("small", "")
-                )
-                img_tag = f'<img src="{img}" loading="lazy">' if img else ""
-                cards.append(
-                    f'<a class="icard" href="{url}" target="_blank">'
-                    f"  {img_tag}"
-                    f'  <div class="ttl">{title}</div>'
-                    f'  <div class="dt">📅 {date}　👤 {aname}</div>'
-                    f"</a>"
-                )
             st.markdown(
-                '<div class="hscroll">' + "".join(cards) + "</div>",
+                cached_hscroll_html(
+                    ("fanza_pickup",),
+                    (fanza_card(item, aname) for item, aname in unique_latest),
+                ),
                 unsafe_allow_html=True,
             )
             st.markdown("---")
@@ -1453,29 +1472,37 @@ else:
                     unsafe_allow_html=True,
                 )
                 st.caption("NHブログの最新記事")
-                cards = []
-                for item in unique_nh_latest:
-                    title = item.get("title", "タイトル不明")
-                    aname = item.get("_actress_name", "")
-                    date = item.get("date", "")[:10]
-                    url = item.get("_link", "#")
-                    img = item.get("_thumbnail", "")
-                    img_tag = f'<img src="{img}" loading="lazy">' if img else ""
-                    cards.append(
-                        f'<a class="icard" href="{url}" target="_blank">'
-                        f"  {img_tag}"
-                        f'  <div class="ttl">{title}</div>'
-                        f'  <div class="dt">📅 {date}　👤 {aname}</div>'
-                        f"</a>"
-                    )
                 st.markdown(
-                    '<div class="hscroll">' + "".join(cards) + "</div>",
+                    cached_hscroll_html(
+                        ("blog_pickup",),
+                        (
+                            blog_card(
+                                item.get("title", ""), item.get("link", ""),
+                                item.get("thumbnail", ""), item.get("published", ""),
+                                aname,
+                            )
+                            for item, aname in unique_nh_latest
+                        ),
+                    ),
                     unsafe_allow_html=True,
                 )
                 st.markdown("---")
 
             members = groups[g]
-            with st.expander(f"📂 {g}（{len(members)}人）", expanded=False):
+            label = f"📂 {g}（{len(members)}人）"
+            if LAZY_GROUPS:
+                # 開閉状態はセッションに保存し、開いているグループだけ取得する
+                opened = st.toggle(
+                    label, value=g in st.session_state.open_groups,
+                    key=f"group_open_{g}", on_change=_cb_toggle_group, args=(g,),
+                )
+                if not opened:
+                    continue
+                _load_members(members)
+                section = st.container(border=True)
+            else:
+                section = st.expander(label, expanded=False)
+            with section:
                 for i, member in enumerate(members):
                     actress = member["row"]
                     name = actress["name"]
@@ -1486,11 +1513,11 @@ else:
                     if source == "NH_BLOG":
                         render_actress_header(name, face_url)
                         items = blog_cache.get(actress_id, [])
-                        render_hscroll_blog(items)
+                        render_hscroll_blog(items, actress_id)
                     else:
                         render_actress_header(name, face_url)
                         items = filtered_cache.get(actress_id, [])
-                        render_hscroll(items)
+                        render_hscroll(items, actress_id)
                     st.markdown("---")
 
 
@@ -0,0 +1,104 @@
+"""
+bench_filters.py − フィルタ処理のベンチマーク
+==============================================
+filters.filter_items (1 件ずつのループ) と filters.filter_mask
+(pandas の列演算) を 1k / 10k / 100k 件の合成データで比較する。
+mask は正規化済み DataFrame に対する判定のみと、正規化 (items_to_frame)
+込みの 2 通りを計測する。計測前に両者の残す/除外する判定が 1 件残らず
+一致することを確認する。
+
+使い方:
+    python bench_filters.py
+"""
+
+import random
+import time
+
+from filters import (
+    EXCLUDE_GENRES, EXCLUDE_TITLE_PREFIXES, EXCLUDE_TITLE_SUFFIXES, EXCLUDE_WORDS,
+    filter_items, filter_mask, items_to_frame,
+)
+
+SIZES = (1_000, 10_000, 100_000)
+_TITLE_PARTS = (
+    EXCLUDE_WORDS + EXCLUDE_TITLE_PREFIXES + EXCLUDE_TITLE_SUFFIXES
+    + ["新人デビュー", "密着ドキュメント", "温泉旅行", "完全主観", " "] * 6
+)
+_IMAGES = (
+    {},
+    {"large": "https://pics.dmm.co.jp/mono/movie/now_printing/now_printing.jpg"},
+    {"large": "https://pics.dmm.co.jp/mono/movie/adult/abc123/abc123pl.jpg",
+     "small": "https://pics.dmm.co.jp/mono/movie/adult/abc123/abc123ps.jpg"},
+    {"small": "https://pics.dmm.co.jp/mono/movie/adult/xyz789/xyz789ps.jpg"},
+)
+
+
+def make_items(n: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        title = "".join(rnd.choice(_TITLE_PARTS) for _ in range(rnd.randint(1, 4)))
+        items.append({
+            "content_id": f"bench{i:06d}",
+            "title": title,
+            "iteminfo": {
+                "genre": [
+                    {"name": rnd.choice(EXCLUDE_GENRES + ["単体作品", "巨乳", "ドラマ"] * 5)}
+                    for _ in range(rnd.randint(0, 4))
+                ],
+                "actress": [{"id": j} for j in range(rnd.choice((1, 1, 2, 3, 5)))],
+                "comment": rnd.choice(["", "", "", "○○と同じ内容です。"]),
+            },
+            "review": rnd.choice(["", {"count": 3, "average": "4.00"}]),
+            "sampleMovieURL": rnd.choice([None, {"size_720_480": "x"}]),
+            "sampleImageURL": rnd.choice([None, None, {"sample_s": {}}]),
+            "imageURL": rnd.choice(_IMAGES),
+        })
+    return items
+
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_parity(items: list[dict], df) -> None:
+    """ループと filter_mask の判定 (残す/除外する) が全件一致することを確認する。"""
+    for require in (False, True):
+        kept = {
+            it["content_id"]
+            for it in filter_items(items, max_items=len(items), require_sample_video=require)
+        }
+        expected = [it["content_id"] in kept for it in items]
+        actual = filter_mask(df, require_sample_video=require).tolist()
+        assert expected == actual, (
+            f"判定結果が一致しません (n={len(items)}, require={require})"
+        )
+
+
+def main():
+    print(
+        f"{'items':>8} {'loop (ms)':>10} {'mask (ms)':>10}"
+        f" {'frame+mask':>11} {'mask/loop':>10}"
+    )
+    for n in SIZES:
+        items = make_items(n)
+        df = items_to_frame(items)
+        check_parity(items, df)
+        loop = _time(lambda: filter_items(items, max_items=n, require_sample_video=True))
+        mask = _time(lambda: filter_mask(df, require_sample_video=True))
+        full = _time(
+            lambda: filter_mask(items_to_frame(items), require_sample_video=True)
+        )
+        print(
+            f"{n:>8} {loop * 1000:>10.1f} {mask * 1000:>10.1f}"
+            f" {full * 1000:>11.1f} {mask / loop:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
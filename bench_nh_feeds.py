@@ -0,0 +1,155 @@
+"""
+bench_nh_feeds.py − NHブログ RSS 処理のベンチマーク
+====================================================
+bench_fixtures/nh_feeds/ に保存したカテゴリ RSS を対象に、
+
+- サムネイル選択: 従来の 3 パス (毎回コンパイル) と nh_blog._pick_thumbnail (1 パス)
+- フィード全体: feedparser による従来パースと nh_blog.parse_category_feed
+
+を比較する。どちらも結果が一致することを確認してから計測する。
+
+フィクスチャは --capture で実フィードを取得して保存する (投稿者名は
+匿名化する)。保存済みの実フィードが 1 つもなければ、構造だけを
+まねた合成フィード (bench_fixtures/nh_feeds/synthetic/) で計測する。
+
+使い方:
+    python bench_nh_feeds.py --capture tagyou/takanashi_kanon ...
+    python bench_nh_feeds.py [フィクスチャのディレクトリ]
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+from xml.etree import ElementTree
+
+import requests
+
+from nh_blog import (
+    _CONTENT_ENCODED, NH_BLOG_UA, RSS_TIMEOUT, _parse_category_feed_lenient,
+    _pick_thumbnail, category_rss_url, parse_category_feed,
+)
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bench_fixtures", "nh_feeds"
+)
+SYNTHETIC_DIR = os.path.join(FIXTURE_DIR, "synthetic")
+MAX_ITEMS = 5
+
+_CREATOR_RE = re.compile(rb"<dc:creator>.*?</dc:creator>", re.DOTALL)
+
+
+# ---------------------------------------------------------------------------
+# フィクスチャの取得
+# ---------------------------------------------------------------------------
+def anonymize(body: bytes) -> bytes:
+    """投稿者名 (dc:creator) を伏せる。それ以外はそのまま残す。"""
+    return _CREATOR_RE.sub(b"<dc:creator><![CDATA[author]]></dc:creator>", body)
+
+
+def capture(category_paths: list[str], fixture_dir: str) -> None:
+    """カテゴリ RSS を取得し、カテゴリパスごとに 1 ファイルで保存する。"""
+    os.makedirs(fixture_dir, exist_ok=True)
+    for path in category_paths:
+        resp = requests.get(
+            category_rss_url(path), headers={"User-Agent": NH_BLOG_UA},
+            timeout=RSS_TIMEOUT,
+        )
+        resp.raise_for_status()
+        out = os.path.join(fixture_dir, path.strip("/").replace("/", "__") + ".xml")
+        with open(out, "wb") as f:
+            f.write(anonymize(resp.content))
+        print(f"保存しました: {out} ({len(resp.content)} bytes)")
+
+
+# ---------------------------------------------------------------------------
+# 計測
+# ---------------------------------------------------------------------------
+def legacy_pick_thumbnail(content: str) -> str:
+    """変更前の実装 (比較用)。"""
+    imgs = re.findall(r'<img[^>]+src=["\']([^"\']+)["\']', content)
+    thumb = ""
+    for img in imgs:
+        if re.search(r'(?:pl|top)\.(?:jpg|jpeg|png|webp)', img, re.IGNORECASE):
+            thumb = img
+            break
+    if not thumb:
+        for img in imgs:
+            if not re.search(r'(?:jp-\d+|-\d+|_\d+)\.(?:jpg|jpeg|png|webp)|bannar', img, re.IGNORECASE):
+                thumb = img
+                break
+    if not thumb and imgs:
+        thumb = imgs[0]
+    return thumb
+
+
+def load_contents(bodies: list[bytes]) -> list[str]:
+    """全フィクスチャの全記事本文 HTML を集める。"""
+    contents = []
+    for body in bodies:
+        for item in ElementTree.fromstring(body).iter("item"):
+            contents.append(
+                item.findtext(_CONTENT_ENCODED) or item.findtext("description") or ""
+            )
+    return contents
+
+
+def _time(fn, repeat: int = 5, number: int = 20) -> float:
+    """1 回あたりの最良時間 (秒)。"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NHブログ RSS 処理のベンチマーク")
+    parser.add_argument("fixture_dir", nargs="?", default=FIXTURE_DIR,
+                        help="フィクスチャのディレクトリ")
+    parser.add_argument("--capture", nargs="+", metavar="CATEGORY_PATH",
+                        help="実フィードを取得してフィクスチャとして保存する")
+    args = parser.parse_args()
+    if args.capture:
+        capture(args.capture, args.fixture_dir)
+        return
+
+    paths = sorted(glob.glob(os.path.join(args.fixture_dir, "*.xml")))
+    if not paths and args.fixture_dir == FIXTURE_DIR:
+        print("[INFO] 実フィードのフィクスチャがないため合成フィードで計測します。")
+        paths = sorted(glob.glob(os.path.join(SYNTHETIC_DIR, "*.xml")))
+    if not paths:
+        print(f"フィクスチャがありません: {args.fixture_dir}")
+        return
+    bodies = [open(p, "rb").read() for p in paths]
+    contents = load_contents(bodies)
+
+    for content in contents:
+        assert _pick_thumbnail(content) == legacy_pick_thumbnail(content), content[:200]
+    for path, body in zip(paths, bodies):
+        for n in (1, MAX_ITEMS, 1000):
+            assert parse_category_feed(body, n) == _parse_category_feed_lenient(body, n), (
+                f"パース結果が一致しません ({os.path.basename(path)}, max_items={n})"
+            )
+
+    legacy = _time(lambda: [legacy_pick_thumbnail(c) for c in contents], number=200)
+    single = _time(lambda: [_pick_thumbnail(c) for c in contents], number=200)
+    print(f"thumbnail: {len(contents)} 記事")
+    print(f"  legacy  {legacy * 1000:>8.2f} ms")
+    print(f"  1-pass  {single * 1000:>8.2f} ms  ({single / legacy:.2f}x)")
+
+    print(f"\n{'feed':<20} {'bytes':>8} {'feedparser (ms)':>16} {'iterparse (ms)':>15} {'ratio':>7}")
+    for path, body in zip(paths, bodies):
+        fp = _time(lambda: _parse_category_feed_lenient(body, MAX_ITEMS), number=5)
+        it = _time(lambda: parse_category_feed(body, MAX_ITEMS), number=5)
+        print(
+            f"{os.path.basename(path):<20} {len(body):>8} {fp * 1000:>16.2f}"
+            f" {it * 1000:>15.2f} {it / fp:>6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
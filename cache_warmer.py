@@ -0,0 +1,158 @@
+"""
+cache_warmer.py − 永続 HTTP キャッシュの先回り更新
+===================================================
+期限切れ間近のキャッシュエントリ (DMM ItemList / NHブログ RSS) を
+バックグラウンドで取り直し、ページを開いた人が上流 API を待たないようにする。
+
+- 対象はおよそ TTL 1 回分以内に読まれたエントリだけ (誰も見ていない女優は
+  温めない)。取り直しでは読まれた扱いにしないので、1 回読まれたキーが
+  温められるのはだいたい 1 回まで
+- 取り直しは 1 件ずつ行い、クライアントのレートリミッタ (閲覧者と共有) を通す
+- 取り直しでは最終アクセス時刻を更新しない (LRU・対象選定を歪めない)
+
+app.py はサーバープロセスごとに 1 度だけ CacheWarmer.start() する。
+単体でも実行できる (app.py と同じ .cache/http_cache.sqlite を温める):
+
+    python cache_warmer.py           # 1 回だけ
+    python cache_warmer.py --loop    # 常駐
+
+環境変数:
+    - DMM_API_ID / DMM_AFFILIATE_ID : 無ければ NHブログ RSS だけを温める
+"""
+
+import argparse
+import os
+import threading
+import time
+from typing import Callable
+
+from dmm_client import DmmClient
+from fetch_pool import HostRateLimiter
+from http_cache import HttpCache
+from nh_blog import NhBlog
+
+DEFAULT_INTERVAL = 60          # 確認間隔 (秒)
+DEFAULT_MARGIN = 180           # 期限のこの秒数前から取り直す
+DEFAULT_BATCH = 200            # 1 回の確認でソースごとに取り直す最大件数
+DEFAULT_RATE_PER_SEC = 2.0
+
+# source -> キーを取り直す関数
+Refreshers = dict[str, Callable[[str], None]]
+
+
+def build_refreshers(dmm: DmmClient | None, nh: NhBlog | None) -> Refreshers:
+    """キャッシュを持つクライアントだけを source ごとの取り直し関数にする。"""
+    refreshers: Refreshers = {}
+    if dmm is not None and dmm.cache is not None:
+        refreshers["dmm_item"] = lambda key: dmm.warm(key, "dmm_item")
+    if nh is not None and nh.cache is not None:
+        refreshers["nh_rss"] = nh.warm
+    return refreshers
+
+
+class CacheWarmer:
+    """期限切れ間近のエントリを定期的に取り直すスレッド。
+
+    active_window 秒以内に読まれたキーだけを温める。None ならソースごとに
+    TTL + margin (前回の読み取りのあと、期限が 1 回来るまで)。
+    """
+
+    def __init__(
+        self,
+        cache: HttpCache,
+        refreshers: Refreshers,
+        *,
+        interval: float = DEFAULT_INTERVAL,
+        margin: float = DEFAULT_MARGIN,
+        active_window: float | None = None,
+        batch: int = DEFAULT_BATCH,
+    ):
+        self.cache = cache
+        self.refreshers = refreshers
+        self.interval = interval
+        self.margin = margin
+        self.active_window = active_window
+        self.batch = batch
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def run_once(self) -> tuple[int, int]:
+        """1 回分の先回り更新を行い、(成功件数, 失敗件数) を返す。"""
+        now = time.time()
+        refreshed = failed = 0
+        for source, refresh in self.refreshers.items():
+            window = (
+                self.cache.ttl_for(source) + self.margin
+                if self.active_window is None else self.active_window
+            )
+            accessed_since = now - window
+            keys = self.cache.expiring(
+                source, within=self.margin, accessed_since=accessed_since,
+                limit=self.batch,
+            )
+            for key in keys:
+                if self._stop.is_set():
+                    return refreshed, failed
+                try:
+                    refresh(key)
+                    refreshed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"[WARN] キャッシュ更新失敗 ({source}): {key}: {e}")
+        return refreshed, failed
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[WARN] キャッシュウォーマーでエラー: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """バックグラウンドスレッドを開始する (2 回目以降は何もしない)。"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.run_forever, name="cache-warmer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+# ---------------------------------------------------------------------------
+# 単体実行
+# ---------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="永続 HTTP キャッシュを先回りで更新する")
+    parser.add_argument("--loop", action="store_true", help="常駐して定期的に更新する")
+    parser.add_argument("--margin", type=float, default=DEFAULT_MARGIN,
+                        help="期限の何秒前から取り直すか")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_SEC,
+                        help="ホストごとのリクエスト数/秒")
+    args = parser.parse_args()
+
+    cache = HttpCache()
+    limiter = HostRateLimiter(args.rate)
+    api_id = os.environ.get("DMM_API_ID", "")
+    affiliate_id = os.environ.get("DMM_AFFILIATE_ID", "")
+    dmm = (
+        DmmClient(api_id, affiliate_id, cache=cache, limiter=limiter)
+        if api_id and affiliate_id else None
+    )
+    if dmm is None:
+        print("[INFO] DMM_API_ID / DMM_AFFILIATE_ID が無いため NHブログ RSS のみ更新します。")
+    warmer = CacheWarmer(
+        cache, build_refreshers(dmm, NhBlog(cache, limiter=limiter)),
+        margin=args.margin,
+    )
+    if args.loop:
+        warmer.run_forever()
+    else:
+        refreshed, failed = warmer.run_once()
+        print(f"=== キャッシュ更新: 成功 {refreshed} 件 / 失敗 {failed} 件 ===")
+
+
+if __name__ == "__main__":
+    main()
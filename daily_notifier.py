@@ -12,17 +12,31 @@ daily_notifier.py − GitHub Actions 用 FANZA 新着通知
   - app.py と同じフロア (mono/dvd) で検索
   - 過去30日以内の作品のみ対象 (初回爆撃防止)
   - sent_works に記録済みの content_id は通知しない
+
+取得結果は女優ごとのフィルタ済み作品として data/feed_snapshot.json
+(環境変数 FEED_SNAPSHOT_PATH で変更可) にも書き出し、app.py が読む。
+
+実行モード (環境変数 NOTIFIER_MODE):
+  - batch (既定)   : 日付窓スイープ or 女優ごとの個別取得で全件を確認
+  - incremental    : watermarks タブの女優ごとの既読位置と比較し、
+                     変化がない女優は少数件の確認だけでスキップ
 """
 
 import os
 import sys
 import json
-import time
 from datetime import datetime, timedelta
-import requests
 import gspread
+import requests
 from oauth2client.service_account import ServiceAccountCredentials
+from dmm_client import DmmClient
+from fetch_pool import HostRateLimiter, fan_out
+from discord_delivery import DiscordQueue
+from http_cache import HttpCache
+from local_store import SENT_WORKS_COLUMNS, LocalStore, SheetSync
 from filters import filter_items
+from feed_snapshot import ITEMS_PER_ACTRESS, SnapshotBuilder, load_snapshot, write_snapshot
+from seen_index import load_seen_index
 
 # ---------------------------------------------------------------------------
 # 設定読み込み
@@ -30,6 +44,12 @@ from filters import filter_items
 API_ID = os.environ.get("DMM_API_ID", "")
 AFFILIATE_ID = os.environ.get("DMM_AFFILIATE_ID", "")
 DISCORD_WEBHOOK_URL = os.environ.get("DISCORD_WEBHOOK_URL", "")
+NOTIFIER_MODE = os.environ.get("NOTIFIER_MODE", "batch")
+# 1 ならローカルストアを破棄してスプレッドシートから取り込み直す
+STORE_REHYDRATE = os.environ.get("STORE_REHYDRATE", "") == "1"
+# 並列取得のワーカー数と、全ワーカーで共有する DMM API のレート (回/秒)
+NOTIFIER_WORKERS = int(os.environ.get("NOTIFIER_WORKERS", "4"))
+DMM_RATE_PER_SEC = float(os.environ.get("DMM_RATE_PER_SEC", "2"))
 
 if not API_ID or not AFFILIATE_ID:
     print("[ERROR] DMM_API_ID / DMM_AFFILIATE_ID が設定されていません。")
@@ -90,28 +110,22 @@ def ensure_sheet(client, tab_name: str, headers: list[str]):
 # ---------------------------------------------------------------------------
 # DMM API (app.py と同じフロア: mono/dvd)
 # ---------------------------------------------------------------------------
-DMM_ITEM_ENDPOINT = "https://api.dmm.com/affiliate/v3/ItemList"
+# DMM API のレートはスイープ・個別取得・既読位置の確認で共有する
+# (キャッシュで済んだ呼び出しはトークンを使わない)
+dmm = DmmClient(
+    API_ID, AFFILIATE_ID, cache=HttpCache(), pool_size=max(NOTIFIER_WORKERS, 10),
+    limiter=HostRateLimiter(DMM_RATE_PER_SEC),
+)
 
 # 過去何日以内の作品を通知対象とするか
 CUTOFF_DAYS = 30
 
-
-def search_items_by_actress(actress_id: str, hits: int = 30) -> list[dict]:
-    params = {
-        "api_id": API_ID,
-        "affiliate_id": AFFILIATE_ID,
-        "site": "FANZA",
-        "service": "mono",
-        "floor": "dvd",
-        "article": "actress",
-        "article_id": actress_id,
-        "hits": hits,
-        "sort": "date",
-        "output": "json",
-    }
-    resp = requests.get(DMM_ITEM_ENDPOINT, params=params, timeout=15)
-    resp.raise_for_status()
-    return resp.json().get("result", {}).get("items", [])
+# incremental モード: 既読位置の確認に使う件数と、検索窓を作り直すまでの日数
+INCREMENTAL_PROBE_HITS = 5
+WINDOW_RESET_DAYS = CUTOFF_DAYS * 2
+WATERMARK_HEADERS = [
+    "actress_id", "window_start", "head_content_id", "head_date", "total_count",
+]
 
 
 def make_item_url(content_id: str) -> str:
@@ -126,45 +140,100 @@ def is_recent(item: dict, cutoff_date: str) -> bool:
 
 
 # ---------------------------------------------------------------------------
-# Discord 通知
+# incremental モード (女優ごとの既読位置)
 # ---------------------------------------------------------------------------
-def send_discord_notification(actress_name: str, items: list[dict]):
-    if not items:
-        return
+# 検索窓の開始日 (window_start) を固定して gte_date で問い合わせると、
+# 窓内の total_count は新作が増えない限り変わらない。先頭作品と件数が
+# 前回と同じなら新作なしと判断できる (予約作品は発売日順の途中に
+# 割り込むことがあるため、先頭作品だけでは判定しない)。
+def load_watermarks(ws) -> dict[str, dict]:
+    return {
+        str(r.get("actress_id", "")): r
+        for r in ws.get_all_records()
+        if r.get("actress_id")
+    }
 
-    embeds = []
-    for item in items[:10]:
-        title = item.get("title", "タイトル不明")
-        cid = item.get("content_id", "")
-        url = make_item_url(cid) if cid else (item.get("affiliateURL") or item.get("URL", ""))
-        date = item.get("date", "")[:10]
-        img_url = (
-            item.get("imageURL", {}).get("large", "")
-            or item.get("imageURL", {}).get("small", "")
-        )
-        embed = {
-            "title": title,
-            "url": url,
-            "color": 0xFF6699,
-            "fields": [{"name": "発売日", "value": date, "inline": True}],
-        }
-        if img_url:
-            embed["thumbnail"] = {"url": img_url}
-        embeds.append(embed)
-
-    payload = {
-        "content": f"🎬 **{actress_name}** の新作が {len(items)} 件見つかりました！",
-        "embeds": embeds,
+
+def save_watermarks(ws, marks: dict[str, dict]) -> None:
+    rows = [WATERMARK_HEADERS] + [
+        [str(m.get(h, "")) for h in WATERMARK_HEADERS] for m in marks.values()
+    ]
+    ws.update(values=rows, range_name="A1")
+
+
+def poll_actress(
+    actress_id: str, mark: dict | None, cutoff_date: str
+) -> tuple[list[dict] | None, dict]:
+    """既読位置と比較して作品を取得する。
+
+    戻り値は (作品リスト, 新しい既読位置)。前回から変化がなければ
+    作品リストは None。
+    """
+    reset_floor = (datetime.now() - timedelta(days=WINDOW_RESET_DAYS)).strftime("%Y-%m-%d")
+    window_start = cutoff_date
+    if mark and str(mark.get("window_start", "")) >= reset_floor:
+        window_start = str(mark["window_start"])
+
+    result = dmm.actress_item_list(
+        actress_id, INCREMENTAL_PROBE_HITS, gte_date=window_start
+    )
+    items = result.get("items", [])
+    total = int(result.get("total_count", 0) or 0)
+    head = items[0] if items else {}
+    new_mark = {
+        "actress_id": actress_id,
+        "window_start": window_start,
+        "head_content_id": str(head.get("content_id", "")),
+        "head_date": head.get("date", "")[:10],
+        "total_count": total,
     }
 
-    resp = requests.post(
-        DISCORD_WEBHOOK_URL,
-        json=payload,
-        headers={"Content-Type": "application/json"},
-        timeout=15,
+    if (
+        mark
+        and str(mark.get("window_start", "")) == window_start
+        and str(mark.get("head_content_id", "")) == new_mark["head_content_id"]
+        and str(mark.get("total_count", "")) == str(total)
+    ):
+        return None, new_mark
+
+    if total > len(items):
+        items = dmm.search_items_by_actress(actress_id, hits=30, gte_date=window_start)
+    return items, new_mark
+
+
+def update_snapshot(
+    snapshot: SnapshotBuilder, actress_id: str, name: str, raw_items: list[dict]
+) -> None:
+    """スナップショットの女優エントリを更新する。
+
+    通知用の取得は直近の日付窓に絞っているので、窓内だけで表示件数に
+    足りない女優は、ダッシュボードと同じ日付で絞らない最新作品で埋める。
+    """
+    shown = filter_items(raw_items, require_sample_video=True)
+    if len(shown) >= ITEMS_PER_ACTRESS:
+        snapshot.update(actress_id, name, shown)
+        return
+    try:
+        latest = dmm.search_items_by_actress(actress_id, hits=30)
+    except (requests.RequestException, ValueError) as e:
+        print(f"    [WARN] スナップショット用の取得に失敗: {e}")
+        snapshot.update(actress_id, name, shown)
+        return
+    snapshot.update(
+        actress_id, name, filter_items(latest, require_sample_video=True), complete=True
     )
-    if resp.status_code not in (200, 204):
-        print(f"[WARN] Discord通知失敗 (status={resp.status_code}): {resp.text}")
+
+
+# ---------------------------------------------------------------------------
+# Discord 通知
+# ---------------------------------------------------------------------------
+# Webhook のレートリミット対策 (送信間隔はトークンバケットで制御)
+DISCORD_RATE_PER_SEC = 0.5
+
+
+def item_url(item: dict) -> str:
+    cid = item.get("content_id", "")
+    return make_item_url(cid) if cid else (item.get("affiliateURL") or item.get("URL", ""))
 
 
 # ---------------------------------------------------------------------------
@@ -182,16 +251,56 @@ def main():
         print("登録女優がいません。終了します。")
         return
 
-    # 通知履歴 (sent_works)
-    ws_sent = ensure_sheet(client, "sent_works", ["content_id", "title", "date", "actress_name"])
-    sent_records = ws_sent.get_all_records()
-    known_ids = {str(r.get("content_id", "")) for r in sent_records}
+    # 通知履歴 (sent_works) はローカルストアから読み、シートへは write-behind
+    ws_sent = ensure_sheet(client, "sent_works", SENT_WORKS_COLUMNS)
+    store = LocalStore()
+    sync = SheetSync(store, lambda tab: ws_sent, tabs=("sent_works",))
+    sync.flush()  # 前回の実行で未送信のまま終わった分を先に反映
+    if STORE_REHYDRATE or not store.hydrated_at("sent_works"):
+        print("  sent_works をスプレッドシートから取り込み中…")
+        store.hydrate("sent_works", ws_sent.get_all_records())
 
     # 過去30日のカットオフ日 (YYYY-MM-DD)
     cutoff_date = (datetime.now() - timedelta(days=CUTOFF_DAYS)).strftime("%Y-%m-%d")
     print(f"  カットオフ日: {cutoff_date} (これ以降の作品のみ通知)")
 
+    # カットオフ日より古い作品は通知対象外なので、索引には窓内の ID だけ持つ
+    known_ids = load_seen_index(store, "sent_works", cutoff_date)
+    print(f"  通知済み ID: {len(known_ids)} 件 (窓内)")
+
+    # --- 取得: ワーカープールで並列に取得 (DMM API のレートは全体で共有) ---
+    actress_ids = [str(a.get("actress_id", "")) for a in actresses if a.get("actress_id")]
+    incremental = NOTIFIER_MODE == "incremental"
+    if incremental:
+        ws_marks = ensure_sheet(client, "watermarks", WATERMARK_HEADERS)
+        marks = load_watermarks(ws_marks)
+        print(f"  incremental モード: 既読位置 {len(marks)} 件")
+        polled, fetch_errors = fan_out(
+            [
+                (aid, lambda aid=aid: poll_actress(aid, marks.get(aid), cutoff_date))
+                for aid in actress_ids
+            ],
+            workers=NOTIFIER_WORKERS,
+        )
+        items_by_actress = {}
+        prev_marks = dict(marks)
+        for aid, (raw, mark) in polled.items():
+            items_by_actress[aid] = raw
+            marks[aid] = mark
+    else:
+        # 全女優の作品を一括取得 (日付窓スイープ or 女優ごとの個別取得)
+        items_by_actress, fetch_errors = dmm.search_items_by_actresses(
+            actress_ids, gte_date=cutoff_date,
+            workers=NOTIFIER_WORKERS,
+        )
+
+    # --- 書き込み: 結果はメインスレッドだけが順に処理する ---
+    discord = DiscordQueue(DISCORD_WEBHOOK_URL, rate_per_sec=DISCORD_RATE_PER_SEC)
+    snapshot = SnapshotBuilder(load_snapshot())
     total_new = 0
+    # 通知予定の sent_works 行と女優 ID (content_id -> 行 / ID)
+    pending_rows: dict[str, list[str]] = {}
+    pending_actress: dict[str, str] = {}
 
     for act in actresses:
         name = act.get("name", "不明")
@@ -199,13 +308,18 @@ def main():
         if not actress_id:
             continue
 
-        print(f"  検索中: {name} (ID: {actress_id})")
-        try:
-            raw_items = search_items_by_actress(actress_id)
-            items = filter_items(raw_items, max_items=30)
-        except Exception as e:
-            print(f"  [ERROR] API呼び出し失敗: {e}")
+        print(f"  確認中: {name} (ID: {actress_id})")
+        if actress_id in fetch_errors:
+            print(f"  [ERROR] API呼び出し失敗: {fetch_errors[actress_id]}")
+            continue
+        raw_items = items_by_actress.get(actress_id, [])
+        if raw_items is None:
+            snapshot.confirm(actress_id, name)
+            print(f"    → 変化なし")
             continue
+        # ダッシュボード用スナップショット (app.py と同じ条件でフィルタ)
+        update_snapshot(snapshot, actress_id, name, raw_items)
+        items = filter_items(raw_items, max_items=30)
 
         # 未通知 かつ 過去30日以内の作品のみ
         new_items = [
@@ -222,23 +336,48 @@ def main():
         print(f"    → 新作 {len(new_items)} 件検出！ Discord へ通知します。")
         total_new += len(new_items)
 
-        # Discord 通知
-        send_discord_notification(name, new_items)
-
-        # sent_works に記録
-        rows_to_add = []
+        # sent_works への記録は、その作品を含むメッセージを送れた直後に行う
         for item in new_items:
             cid = str(item.get("content_id", ""))
             title = item.get("title", "")
             date = item.get("date", "")[:10]
-            rows_to_add.append([cid, title, date, name])
+            pending_rows[cid] = [cid, title, date, name]
+            pending_actress[cid] = actress_id
             known_ids.add(cid)
 
-        if rows_to_add:
-            ws_sent.append_rows(rows_to_add)
+        # Discord 通知 (実行の最後にまとめて送信)
+        discord.add(name, new_items, item_url)
+
+    # メッセージごとにローカルの outbox へ記録する (途中で落ちても二重通知しない)。
+    # 送れなかった作品は記録せず、次回の実行で改めて通知する
+    sent, undelivered = discord.flush(
+        on_sent=lambda cids: store.append_records(
+            "sent_works", [pending_rows[c] for c in cids if c in pending_rows]
+        )
+    )
+    print(f"  Discord へ {sent} 件のメッセージを送信しました。")
+    failed_ids = {cid for _, content_ids in undelivered for cid in content_ids}
+    if undelivered:
+        print(
+            f"  [WARN] {len(undelivered)} 件のメッセージ ({len(failed_ids)} 作品) を"
+            " 送信できませんでした。次回再送します。"
+        )
 
-        # API レートリミット対策
-        time.sleep(1)
+    if incremental:
+        # 送れなかった作品がある女優は既読位置を進めない
+        for aid in {pending_actress[cid] for cid in failed_ids}:
+            if aid in prev_marks:
+                marks[aid] = prev_marks[aid]
+            else:
+                marks.pop(aid, None)
+        save_watermarks(ws_marks, marks)
+    sync.flush()
+
+    try:
+        write_snapshot(snapshot.build(actress_ids))
+        print("  フィードのスナップショットを書き出しました。")
+    except OSError as e:
+        print(f"  [WARN] スナップショットの書き出しに失敗: {e}")
 
     print(f"=== 完了: 新作合計 {total_new} 件 ===")
 
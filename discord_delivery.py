@@ -0,0 +1,206 @@
+"""
+discord_delivery.py − Discord Webhook 配信キュー
+=================================================
+notify.py / daily_notifier.py 共通の通知送信部。
+
+- 複数女優の embed を 1 メッセージに詰める (10 embed / 合計 6000 文字以内)
+- 10 件を超える作品も切り捨てずに複数メッセージへ分割
+- 429 は Retry-After (ヘッダー / JSON の retry_after) に従って再送
+- 5xx・タイムアウト・接続エラーは指数バックオフで再送
+- flush() は送れたメッセージごとに on_sent でその作品 ID を知らせ (呼び出し側で
+  すぐ通知済みとして記録できるように)、送れなかった分は作品 ID ごと返す
+- 送信間隔はトークンバケットで制御
+"""
+
+import time
+from typing import Callable
+
+import requests
+
+from fetch_pool import RateLimiter
+
+# Discord の制限値
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_CONTENT_CHARS = 2000
+MAX_TITLE_CHARS = 256
+
+DEFAULT_RATE_PER_SEC = 0.5
+DEFAULT_MAX_RETRIES = 5
+EMBED_COLOR = 0xFF6699
+
+
+def item_embed(item: dict, url: str, actress_name: str = "") -> dict:
+    """作品 1 件分の embed を作る。"""
+    title = item.get("title", "タイトル不明")
+    if len(title) > MAX_TITLE_CHARS:
+        title = title[: MAX_TITLE_CHARS - 1] + "…"
+    date = item.get("date", "")[:10]
+    img_url = (
+        item.get("imageURL", {}).get("large", "")
+        or item.get("imageURL", {}).get("small", "")
+    )
+    embed = {
+        "title": title,
+        "url": url,
+        "color": EMBED_COLOR,
+        "fields": [{"name": "発売日", "value": date or "-", "inline": True}],
+    }
+    if actress_name:
+        embed["author"] = {"name": actress_name}
+    if img_url:
+        embed["thumbnail"] = {"url": img_url}
+    return embed
+
+
+def embed_chars(embed: dict) -> int:
+    """Discord の 6000 文字制限で数えられる文字数。"""
+    n = len(embed.get("title", "")) + len(embed.get("description", ""))
+    n += len(embed.get("author", {}).get("name", ""))
+    n += len(embed.get("footer", {}).get("text", ""))
+    for f in embed.get("fields", []):
+        n += len(f.get("name", "")) + len(f.get("value", ""))
+    return n
+
+
+class DiscordQueue:
+    """通知をためておき、flush() で最小限のメッセージ数にまとめて送る。"""
+
+    def __init__(
+        self,
+        webhook_url: str,
+        *,
+        rate_per_sec: float = DEFAULT_RATE_PER_SEC,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        timeout: float = 15,
+    ):
+        self.webhook_url = webhook_url
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate_per_sec)
+        self.session = requests.Session()
+        # (女優名, 件数, [(content_id, embed), ...])
+        self._groups: list[tuple[str, int, list[tuple[str, dict]]]] = []
+
+    def add(
+        self,
+        actress_name: str,
+        items: list[dict],
+        url_for: Callable[[dict], str],
+    ) -> None:
+        """女優 1 人分の新作を予約する。url_for は作品から URL を返す関数。"""
+        if items:
+            embeds = [
+                (str(it.get("content_id", "")), item_embed(it, url_for(it), actress_name))
+                for it in items
+            ]
+            self._groups.append((actress_name, len(items), embeds))
+
+    def pack(self) -> list[dict]:
+        """予約済みの通知を Webhook ペイロードのリストに詰める。"""
+        return [payload for payload, _ in self._pack()]
+
+    def _pack(self) -> list[tuple[dict, list[str]]]:
+        """(ペイロード, 含まれる作品の content_id) のリストに詰める。"""
+        packed: list[tuple[dict, list[str]]] = []
+        lines: list[str] = []
+        embeds: list[dict] = []
+        content_ids: list[str] = []
+        chars = 0
+
+        def _close():
+            nonlocal lines, embeds, content_ids, chars
+            if embeds:
+                content = "\n".join(lines)
+                if len(content) > MAX_CONTENT_CHARS:
+                    content = content[: MAX_CONTENT_CHARS - 1] + "…"
+                packed.append(({"content": content, "embeds": embeds}, content_ids))
+            lines, embeds, content_ids, chars = [], [], [], 0
+
+        for name, count, group in self._groups:
+            first = True
+            for cid, embed in group:
+                size = embed_chars(embed)
+                if (
+                    len(embeds) >= MAX_EMBEDS_PER_MESSAGE
+                    or chars + size > MAX_EMBED_CHARS_PER_MESSAGE
+                ):
+                    _close()
+                if first:
+                    lines.append(f"🎬 **{name}** の新作が {count} 件見つかりました！")
+                    first = False
+                elif not embeds:
+                    lines.append(f"🎬 **{name}** (続き)")
+                embeds.append(embed)
+                content_ids.append(cid)
+                chars += size
+        _close()
+        return packed
+
+    def flush(
+        self, on_sent: Callable[[list[str]], None] | None = None
+    ) -> tuple[int, list[tuple[dict, list[str]]]]:
+        """予約済みの通知をすべて送信する。
+
+        on_sent を渡すと、メッセージを 1 件送れるたびにそのメッセージに
+        含まれる作品の content_id で呼ぶ。途中でプロセスが落ちても、
+        送れた分は記録済みにできる。
+
+        戻り値は (送信したメッセージ数, 送れなかった分) で、送れなかった分は
+        (ペイロード, 含まれる作品の content_id) のリスト。1 件失敗しても
+        残りのメッセージの送信は続ける。
+        """
+        packed = self._pack()
+        self._groups = []
+        sent = 0
+        undelivered: list[tuple[dict, list[str]]] = []
+        for payload, content_ids in packed:
+            if self._post(payload):
+                sent += 1
+                if on_sent is not None:
+                    on_sent(content_ids)
+            else:
+                undelivered.append((payload, content_ids))
+        return sent, undelivered
+
+    def _post(self, payload: dict) -> bool:
+        """1 メッセージを送る。再送しても送れなければ False を返す (例外は投げない)。"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                resp = self.session.post(self.webhook_url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    print(f"[WARN] Discord通知失敗: {e}")
+                    return False
+                wait = 2 ** attempt
+                print(f"[WARN] Discord通知を再送します ({e}, {wait:.1f}秒後)")
+                time.sleep(wait)
+                continue
+            if resp.status_code in (200, 204):
+                return True
+            if resp.status_code == 429 or resp.status_code >= 500:
+                wait = _retry_after(resp) if resp.status_code == 429 else 2 ** attempt
+                print(
+                    f"[WARN] Discord通知を再送します (status={resp.status_code},"
+                    f" {wait:.1f}秒後)"
+                )
+                time.sleep(wait)
+                continue
+            break
+        print(f"[WARN] Discord通知失敗 (status={resp.status_code}): {resp.text}")
+        return False
+
+
+def _retry_after(resp) -> float:
+    """429 応答から待機秒数を読む。ヘッダー → JSON の順に見る。"""
+    header = resp.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        return float(resp.json().get("retry_after", 1))
+    except (ValueError, AttributeError):
+        return 1.0
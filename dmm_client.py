@@ -0,0 +1,311 @@
+"""
+dmm_client.py − DMM Affiliate API 共通クライアント
+===================================================
+app.py / notify.py / daily_notifier.py から共通で使う API クライアント。
+keep-alive の requests.Session をコネクションプール付きで使い回し、
+リトライ・タイムアウト方針をここに一本化する。
+"""
+
+import json
+from typing import TypedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http_cache import HttpCache
+from fetch_pool import HostRateLimiter, fan_out
+
+DMM_API_BASE = "https://api.dmm.com/affiliate/v3"
+DMM_ITEM_ENDPOINT = DMM_API_BASE + "/ItemList"
+DMM_ACTRESS_ENDPOINT = DMM_API_BASE + "/ActressSearch"
+DMM_API_HOST = "api.dmm.com"
+
+DEFAULT_TIMEOUT = 15
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 16
+MAX_HITS = 100          # ItemList の hits 上限
+MAX_OFFSET = 50000      # ItemList の offset 上限
+
+
+class ItemListResult(TypedDict, total=False):
+    """ItemList API の result 部分。"""
+    status: int
+    result_count: int
+    total_count: int
+    first_position: int
+    items: list[dict]
+
+
+class ActressSearchResult(TypedDict, total=False):
+    """ActressSearch API の result 部分。"""
+    status: str
+    result_count: int
+    total_count: str
+    first_position: int
+    actress: list[dict]
+
+
+class DmmClient:
+    """DMM Affiliate API v3 クライアント。
+
+    1 インスタンスにつき 1 つの Session を持ち、同じホストへの接続を
+    keep-alive で再利用する。スレッド間で共有してよい。
+    cache を渡すとレスポンスを永続キャッシュ経由で取得する。
+    limiter を渡すと、キャッシュで済まず実際に API を呼ぶときだけ
+    DMM_API_HOST のトークンを取得する (スイープ・個別取得で共有)。
+    """
+
+    def __init__(
+        self,
+        api_id: str,
+        affiliate_id: str,
+        *,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        cache: HttpCache | None = None,
+        limiter: HostRateLimiter | None = None,
+    ):
+        self.api_id = api_id
+        self.affiliate_id = affiliate_id
+        self.timeout = timeout
+        self.cache = cache
+        self.limiter = limiter
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("https://", adapter)
+
+    def _get(self, endpoint: str, params: dict, source: str | None) -> dict:
+        """source が None ならレスポンス本文はキャッシュしない。"""
+        query = {
+            "api_id": self.api_id,
+            "affiliate_id": self.affiliate_id,
+            "output": "json",
+            **params,
+        }
+        if self.cache is not None and source is not None:
+            body = self.cache.fetch(
+                self.session, endpoint,
+                source=source, params=query, timeout=self.timeout,
+                throttle=self._throttle,
+            )
+            return json.loads(body).get("result", {})
+        self._throttle()
+        resp = self.session.get(endpoint, params=query, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json().get("result", {})
+
+    def warm(self, key: str, source: str) -> None:
+        """キャッシュキー (認証情報を除いた URL) のレスポンスを取り直す。
+        cache がなければ何もしない。"""
+        if self.cache is None:
+            return
+        self.cache.fetch(
+            self.session, key, source=source, timeout=self.timeout, warm=True,
+            params={"api_id": self.api_id, "affiliate_id": self.affiliate_id},
+            throttle=self._throttle,
+        )
+
+    def _throttle(self) -> None:
+        if self.limiter is not None:
+            self.limiter.acquire(DMM_API_HOST)
+
+    # -----------------------------------------------------------------------
+    # ItemList
+    # -----------------------------------------------------------------------
+    def item_list(self, **params) -> ItemListResult:
+        """ItemList を任意のパラメータで呼び出し、result をそのまま返す。"""
+        return self._get(DMM_ITEM_ENDPOINT, params, "dmm_item")
+
+    def actress_item_list(
+        self,
+        actress_id: str,
+        hits: int = 30,
+        *,
+        service: str = "mono",
+        floor: str = "dvd",
+        gte_date: str | None = None,
+    ) -> ItemListResult:
+        """指定女優 ID の作品を新しい順に取得し、result (total_count 含む) を返す。"""
+        params = {
+            "site": "FANZA",
+            "service": service,
+            "floor": floor,
+            "article": "actress",
+            "article_id": actress_id,
+            "hits": hits,
+            "sort": "date",
+        }
+        if gte_date:
+            params["gte_date"] = _iso_date(gte_date)
+        return self.item_list(**params)
+
+    def search_items_by_actress(
+        self,
+        actress_id: str,
+        hits: int = 30,
+        *,
+        service: str = "mono",
+        floor: str = "dvd",
+        gte_date: str | None = None,
+    ) -> list[dict]:
+        """指定女優 ID の作品を新しい順に取得。"""
+        result = self.actress_item_list(
+            actress_id, hits, service=service, floor=floor, gte_date=gte_date
+        )
+        return result.get("items", [])
+
+    # -----------------------------------------------------------------------
+    # ItemList (ロスター一括取得)
+    # -----------------------------------------------------------------------
+    # ItemList の article/article_id を繰り返し指定すると AND 条件
+    # (全員が共演する作品) になるため、複数女優の OR 検索には使えない。
+    # 代わりにフロア全体を日付窓でスイープし、iteminfo.actress[].id で
+    # 女優ごとに振り分ける。
+    def count_items(
+        self, *, gte_date: str, service: str = "mono", floor: str = "dvd"
+    ) -> int:
+        """gte_date 以降のフロア全体の作品数を返す。"""
+        result = self.item_list(
+            site="FANZA", service=service, floor=floor,
+            gte_date=_iso_date(gte_date), hits=1, sort="date",
+        )
+        return int(result.get("total_count", 0) or 0)
+
+    def sweep_items(
+        self,
+        *,
+        gte_date: str,
+        service: str = "mono",
+        floor: str = "dvd",
+        max_pages: int | None = None,
+    ) -> list[dict]:
+        """gte_date 以降のフロア全体の作品を新しい順に全ページ取得する。"""
+        items: list[dict] = []
+        offset = 1
+        pages = 0
+        while offset <= MAX_OFFSET:
+            result = self.item_list(
+                site="FANZA", service=service, floor=floor,
+                gte_date=_iso_date(gte_date), hits=MAX_HITS,
+                offset=offset, sort="date",
+            )
+            page = result.get("items", [])
+            items.extend(page)
+            pages += 1
+            total = int(result.get("total_count", 0) or 0)
+            offset += len(page)
+            if len(page) < MAX_HITS or offset > total:
+                break
+            if max_pages is not None and pages >= max_pages:
+                break
+        return items
+
+    def search_items_by_actresses(
+        self,
+        actress_ids: list[str],
+        *,
+        gte_date: str,
+        hits: int = 30,
+        service: str = "mono",
+        floor: str = "dvd",
+        workers: int = 1,
+    ) -> tuple[dict[str, list[dict]], dict[str, Exception]]:
+        """複数女優の gte_date 以降の作品をまとめて取得する。
+
+        スイープに必要なページ数が女優数より少なければ日付窓スイープ、
+        そうでなければ女優ごとの個別取得を workers 並列で行う。
+        どちらの経路の API 呼び出しも self.limiter の同じ予算を使う。
+        戻り値は (女優ID -> 作品リスト, 女優ID -> 例外)。
+        """
+        ids = list(dict.fromkeys(str(a) for a in actress_ids if a))
+        if not ids:
+            return {}, {}
+
+        try:
+            total = self.count_items(gte_date=gte_date, service=service, floor=floor)
+            pages = -(-total // MAX_HITS)
+            if pages < len(ids) and total <= MAX_OFFSET:
+                swept = self.sweep_items(gte_date=gte_date, service=service, floor=floor)
+                return group_items_by_actress(swept, ids), {}
+        except (requests.RequestException, ValueError):
+            # スイープに失敗したら (通信エラー・壊れた JSON) 個別取得にフォールバック
+            pass
+
+        # 個別取得もスイープと同じ日付窓に揃える
+        return fan_out(
+            [
+                (aid, lambda aid=aid: self.search_items_by_actress(
+                    aid, hits=hits, service=service, floor=floor, gte_date=gte_date
+                ))
+                for aid in ids
+            ],
+            workers=workers,
+        )
+
+    # -----------------------------------------------------------------------
+    # ActressSearch
+    # -----------------------------------------------------------------------
+    def actress_search(self, **params) -> ActressSearchResult:
+        """ActressSearch を任意のパラメータで呼び出し、result をそのまま返す。"""
+        return self._get(DMM_ACTRESS_ENDPOINT, params, "dmm_actress")
+
+    def search_actresses(
+        self, keyword: str, hits: int = 10, *, refresh: bool = False
+    ) -> list[dict]:
+        """名前キーワードで女優を検索。
+
+        cache があれば結果リストを名前空間 "actress_search" に保存し
+        (0 件の結果は保存しない)、TTL 内の再検索では API を呼ばない。
+        refresh=True で保存済みの結果を捨てて取り直す。
+        """
+        key = f"{hits}:{keyword}"
+        if self.cache is not None:
+            if refresh:
+                self.cache.invalidate_values("actress_search", key)
+            else:
+                cached = self.cache.get_value("actress_search", key)
+                if cached is not None:
+                    return cached
+        # 結果リストを保存するので、レスポンス本文は二重に保存しない
+        actresses = self._get(
+            DMM_ACTRESS_ENDPOINT, {"keyword": keyword, "hits": hits}, None
+        ).get("actress", [])
+        if self.cache is not None and actresses:
+            self.cache.put_value("actress_search", key, actresses)
+        return actresses
+
+
+# ---------------------------------------------------------------------------
+# ヘルパー
+# ---------------------------------------------------------------------------
+def _iso_date(date: str) -> str:
+    """YYYY-MM-DD を API の gte_date 形式 (YYYY-MM-DDT00:00:00) に揃える。"""
+    return date if "T" in date else f"{date[:10]}T00:00:00"
+
+
+def group_items_by_actress(
+    items: list[dict], actress_ids: list[str]
+) -> dict[str, list[dict]]:
+    """作品リストを iteminfo.actress[].id で女優ごとに振り分ける。
+
+    元の並び順 (新しい順) を保ち、actress_ids の全員をキーに含める。
+    """
+    grouped: dict[str, list[dict]] = {str(a): [] for a in actress_ids}
+    for item in items:
+        for performer in item.get("iteminfo", {}).get("actress", []):
+            bucket = grouped.get(str(performer.get("id", "")))
+            if bucket is not None:
+                bucket.append(item)
+    return grouped
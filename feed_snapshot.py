@@ -0,0 +1,251 @@
+"""
+feed_snapshot.py − 女優別フィードのスナップショット
+====================================================
+daily_notifier.py が取得・フィルタ済みの作品を JSON に書き出し、
+app.py はそれを読んで API を呼ばずに一覧・ピックアップを表示する。
+古くなった女優の分だけ app.py 側でライブ取得して補う。
+GitHub Actions では専用ブランチ (feed-snapshot) に置き、app.py は
+secrets の feed_snapshot_url (raw URL) から読む。
+
+形式 (version 1):
+    {
+      "version": 1,
+      "generated_at": "2025-10-10T18:00:00+09:00",
+      "actresses": {
+        "<actress_id>": {
+          "name": "...",
+          "fetched_at": "...",
+          "complete": true,          # 表示件数分そろっている
+          "items": [{content_id, title, date, imageURL: {large, small}}, ...]
+        }
+      },
+      "pickup": [{"actress_id": "...", "content_id": "..."}, ...]
+    }
+"""
+
+import heapq
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import requests
+
+SNAPSHOT_VERSION = 1
+DEFAULT_PATH = os.environ.get(
+    "FEED_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "feed_snapshot.json"),
+)
+# 女優 1 人あたりの表示件数 (app.py の MAX_ITEMS_PER_ACTRESS と同じ)
+ITEMS_PER_ACTRESS = 5
+PICKUP_SIZE = 10
+
+
+# ---------------------------------------------------------------------------
+# 新着ピックアップ
+# ---------------------------------------------------------------------------
+class _NotNewestFirst(ValueError):
+    """top_k_latest に渡したリストが新しい順になっていない。"""
+
+
+def _tagged(items: list[dict], tag, date_of):
+    """(作品, タグ) を順に返す。読んだ範囲で日付が新しくなったら例外。"""
+    prev = None
+    for item in items:
+        date = date_of(item)
+        if prev is not None and date > prev:
+            raise _NotNewestFirst(tag)
+        prev = date
+        yield item, tag
+
+
+def top_k_latest(
+    sources: list[tuple[object, list[dict]]],
+    *,
+    date_of,
+    id_of,
+    k: int = PICKUP_SIZE,
+) -> list[tuple[dict, object]]:
+    """女優ごとの作品リストから、新しい順に重複なしで k 件を選ぶ。
+
+    sources は (タグ, 作品リスト) の並び (タグは女優名や ID)。各リストは
+    新しい順であること (API / RSS の順)。heapq.merge で先頭から k 件
+    そろうまでだけ読むので、全件を連結・ソートしない。並び順の確認も
+    読んだ範囲だけで行い、崩れていればそのときだけ全リストを並べ直して
+    やり直す。同じ日付なら sources の前の方が先 (全件の安定ソートと同じ順)。
+    id_of が空の作品は除外する。戻り値は (作品, タグ) のリスト。
+    """
+    try:
+        return _merge_top_k(sources, date_of, id_of, k)
+    except _NotNewestFirst:
+        resorted = [
+            (tag, sorted(items, key=date_of, reverse=True)) for tag, items in sources
+        ]
+        return _merge_top_k(resorted, date_of, id_of, k)
+
+
+def _merge_top_k(sources, date_of, id_of, k) -> list[tuple[dict, object]]:
+    streams = [_tagged(items, tag, date_of) for tag, items in sources]
+    picked: list[tuple[dict, object]] = []
+    seen: set[str] = set()
+    for item, tag in heapq.merge(*streams, key=lambda p: date_of(p[0]), reverse=True):
+        key = id_of(item)
+        if key and key not in seen:
+            seen.add(key)
+            picked.append((item, tag))
+        if len(picked) >= k:
+            break
+    return picked
+
+
+# ---------------------------------------------------------------------------
+# 作成 (daily_notifier.py)
+# ---------------------------------------------------------------------------
+def compact_item(item: dict) -> dict:
+    """表示に使うフィールドだけを残す。"""
+    image = item.get("imageURL", {}) or {}
+    return {
+        "content_id": item.get("content_id", ""),
+        "title": item.get("title", ""),
+        "date": item.get("date", ""),
+        "imageURL": {"large": image.get("large", ""), "small": image.get("small", "")},
+    }
+
+
+class SnapshotBuilder:
+    """前回のスナップショットを引き継ぎつつ女優ごとのエントリを更新する。"""
+
+    def __init__(self, previous: dict | None = None):
+        self.now = datetime.now().astimezone().isoformat(timespec="seconds")
+        self.entries: dict[str, dict] = dict((previous or {}).get("actresses", {}))
+
+    def update(
+        self,
+        actress_id: str,
+        name: str,
+        filtered_items: list[dict],
+        *,
+        complete: bool | None = None,
+    ) -> None:
+        """フィルタ済み (新しい順) の作品で置き換える。
+
+        complete を省略すると、表示件数分そろっていれば complete とする
+        (日付で絞った取得結果はそれより少ないと足りているか分からない)。
+        日付で絞らない取得結果なら件数が少なくても complete=True を渡す。
+        """
+        items = filtered_items[:ITEMS_PER_ACTRESS]
+        if complete is None:
+            complete = len(items) >= ITEMS_PER_ACTRESS
+        self.entries[str(actress_id)] = {
+            "name": name,
+            "fetched_at": self.now,
+            "complete": complete,
+            "items": [compact_item(it) for it in items],
+        }
+
+    def confirm(self, actress_id: str, name: str) -> None:
+        """前回から変化がないと確認できた女優の取得時刻だけ更新する。"""
+        entry = self.entries.get(str(actress_id))
+        if entry is not None:
+            entry.update(name=name, fetched_at=self.now)
+
+    def build(self, actress_ids: list[str]) -> dict:
+        """登録中の女優だけを残してスナップショットを組み立てる。"""
+        entries = {
+            str(aid): self.entries[str(aid)]
+            for aid in actress_ids if str(aid) in self.entries
+        }
+        pickup = top_k_latest(
+            [(aid, e["items"]) for aid, e in entries.items()],
+            date_of=lambda it: it.get("date", ""),
+            id_of=lambda it: it.get("content_id", ""),
+        )
+        return {
+            "version": SNAPSHOT_VERSION,
+            "generated_at": self.now,
+            "actresses": entries,
+            "pickup": [
+                {"actress_id": aid, "content_id": it["content_id"]} for it, aid in pickup
+            ],
+        }
+
+
+def write_snapshot(snapshot: dict, path: str = DEFAULT_PATH) -> None:
+    """一時ファイルに書いてから置き換える (読み手が途中の状態を見ない)。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# 読み込み (app.py)
+# ---------------------------------------------------------------------------
+def load_snapshot(path: str = DEFAULT_PATH) -> dict:
+    """スナップショットを読む。無い・壊れている・版が違う場合は空の dict。"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return _checked(snapshot)
+
+
+def fetch_snapshot(url: str, timeout: float = 10) -> dict:
+    """URL (専用ブランチの raw URL など) からスナップショットを読む。
+    取れない・壊れている・版が違う場合は空の dict。"""
+    try:
+        resp = requests.get(url, timeout=timeout)
+        resp.raise_for_status()
+        snapshot = resp.json()
+    except (requests.RequestException, ValueError):
+        return {}
+    return _checked(snapshot)
+
+
+def _checked(snapshot) -> dict:
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return {}
+    return snapshot
+
+
+def fresh_entries(snapshot: dict, max_age: timedelta) -> dict[str, list[dict]]:
+    """取得から max_age 以内で表示件数のそろったエントリの作品リストを返す。"""
+    now = datetime.now().astimezone()
+    fresh = {}
+    for aid, entry in snapshot.get("actresses", {}).items():
+        try:
+            age = now - datetime.fromisoformat(entry["fetched_at"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if entry.get("complete") and age <= max_age:
+            fresh[aid] = entry.get("items", [])
+    return fresh
+
+
+def resolve_pickup(
+    snapshot: dict, fresh: dict[str, list[dict]], actress_ids: list[str]
+) -> list[tuple[dict, str]] | None:
+    """保存済みのピックアップを (作品, actress_id) のリストで返す。
+
+    スナップショットの女優が現在の登録と一致し、全員分が新しい場合だけ
+    使える。それ以外は None (呼び出し側で組み立て直す)。
+    """
+    ids = set(actress_ids)
+    if set(snapshot.get("actresses", {})) != ids or not ids <= fresh.keys():
+        return None
+    by_cid = {
+        (aid, it.get("content_id", "")): it for aid in ids for it in fresh[aid]
+    }
+    picked = []
+    for ref in snapshot.get("pickup", []):
+        item = by_cid.get((ref.get("actress_id"), ref.get("content_id")))
+        if item is None:
+            return None
+        picked.append((item, ref["actress_id"]))
+    return picked
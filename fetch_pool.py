@@ -0,0 +1,118 @@
+"""
+fetch_pool.py − 並列フェッチエンジン
+=====================================
+女優ごとの API 呼び出しを上限付きスレッドプールで並列に実行する。
+app.py のダッシュボード描画から使う。
+
+- 同時実行数 (workers) は呼び出し側で指定
+- ホスト単位のレートリミッタ (トークンバケット) を提供する。トークンは
+  fan_out ではなく各クライアント (DmmClient / NhBlog) が実際に通信する
+  ときだけ取得するので、キャッシュで済む呼び出しは待たされない
+- 1 件の失敗が他の女優に波及しないよう、例外はキーごとに分離して返す
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Hashable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE_PER_SEC = 5.0
+
+
+class RateLimiter:
+    """スレッド安全なトークンバケット。
+
+    rate 個/秒でトークンが補充され、最大 burst 個まで貯まる。
+    acquire() はトークンが得られるまでブロックする。
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        if rate <= 0:
+            raise ValueError("rate は正の値を指定してください。")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst if burst is not None else rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """ホスト名ごとに独立した RateLimiter を払い出す。"""
+
+    def __init__(self, rate: float = DEFAULT_RATE_PER_SEC, burst: int | None = None):
+        self.rate = rate
+        self.burst = burst
+        self._limiters: dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, host: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.rate, self.burst)
+                self._limiters[host] = limiter
+            return limiter
+
+    def acquire(self, host: str) -> None:
+        self.for_host(host).acquire()
+
+
+def fan_out(
+    jobs: Iterable[tuple[Hashable, Callable[[], T]]],
+    *,
+    workers: int = DEFAULT_WORKERS,
+    initializer: Callable[[], None] | None = None,
+) -> tuple[dict[Hashable, T], dict[Hashable, Exception]]:
+    """ジョブを並列実行し、(成功結果, 例外) の 2 つの dict を返す。
+
+    レートリミットはかけない (fn の中のクライアントが通信時にかける)。
+
+    Parameters
+    ----------
+    jobs : Iterable[tuple[key, fn]]
+        key は結果 dict のキー、fn は引数なしで呼ばれる取得関数。
+        同じ key は最初の 1 件のみ実行。
+    workers : int
+        同時実行数の上限。
+    initializer : Callable | None
+        各ワーカースレッドの開始時に 1 度だけ呼ばれる。
+    """
+    unique: dict[Hashable, Callable[[], T]] = {}
+    for key, fn in jobs:
+        if key not in unique:
+            unique[key] = fn
+
+    results: dict[Hashable, T] = {}
+    errors: dict[Hashable, Exception] = {}
+    if not unique:
+        return results, errors
+
+    max_workers = max(1, min(workers, len(unique)))
+    with ThreadPoolExecutor(
+        max_workers=max_workers, initializer=initializer
+    ) as pool:
+        futures = {pool.submit(fn): key for key, fn in unique.items()}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                results[key] = fut.result()
+            except Exception as e:
+                errors[key] = e
+    return results, errors
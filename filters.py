@@ -21,6 +21,16 @@ _DUPE_PATTERN = re.compile(r"と同じ内容です。")
 MAX_PERFORMERS = 4
 MAX_ITEMS_PER_ACTRESS = 5
 
+# ---------------------------------------------------------------------------
+# コンパイル済みルール (import 時に 1 度だけ構築)
+# ---------------------------------------------------------------------------
+_EXCLUDE_WORDS_RE = re.compile("|".join(re.escape(w) for w in EXCLUDE_WORDS))
+_EXCLUDE_PREFIXES = tuple(EXCLUDE_TITLE_PREFIXES)
+_EXCLUDE_SUFFIXES = tuple(EXCLUDE_TITLE_SUFFIXES)
+_EXCLUDE_GENRE_SET = frozenset(EXCLUDE_GENRES)
+# "now_printing" も "printing" に含まれるので 1 回の部分一致で判定できる
+_PRINTING_MARK = "printing"
+
 
 def filter_items(
     items: list[dict],
@@ -42,23 +52,23 @@ def filter_items(
     filtered: list[dict] = []
     for item in items:
         title = item.get("title", "")
-        if any(w in title for w in EXCLUDE_WORDS):
+        if _EXCLUDE_WORDS_RE.search(title):
             continue
-        if any(title.startswith(p) for p in EXCLUDE_TITLE_PREFIXES):
+        if title.startswith(_EXCLUDE_PREFIXES):
             continue
-        if any(title.rstrip().endswith(s) for s in EXCLUDE_TITLE_SUFFIXES):
+        if title.rstrip().endswith(_EXCLUDE_SUFFIXES):
             continue
 
-        genres = item.get("iteminfo", {}).get("genre", [])
-        genre_names = [g.get("name", "") for g in genres]
-        if any(eg in genre_names for eg in EXCLUDE_GENRES):
+        iteminfo = item.get("iteminfo", {})
+        genres = iteminfo.get("genre", [])
+        if any(g.get("name", "") in _EXCLUDE_GENRE_SET for g in genres):
             continue
 
-        performers = item.get("iteminfo", {}).get("actress", [])
+        performers = iteminfo.get("actress", [])
         if len(performers) > MAX_PERFORMERS:
             continue
 
-        item_desc = item.get("iteminfo", {}).get("comment", "")
+        item_desc = iteminfo.get("comment", "")
         if isinstance(item_desc, str) and _DUPE_PATTERN.search(item_desc):
             continue
 
@@ -79,12 +89,78 @@ def filter_items(
         small_img = img_urls.get("small") or ""
         if not large_img and not small_img:
             continue
-        if "now_printing" in large_img or "now_printing" in small_img:
-            continue
-        if "printing" in large_img or "printing" in small_img:
+        if _PRINTING_MARK in large_img or _PRINTING_MARK in small_img:
             continue
 
         filtered.append(item)
         if len(filtered) >= max_items:
             break
     return filtered
+
+
+# ---------------------------------------------------------------------------
+# 列指向 (pandas) の一括フィルタ
+# ---------------------------------------------------------------------------
+# filter_items と同じ判定を DataFrame の列演算で行う。数千件以上の
+# ItemList 結果 (sent_works の再構築や監査など) をまとめて判定する用途向け。
+# items_to_frame は値を取り出すだけで、判定はすべて filter_mask の列演算で行う。
+# タイトルの 3 ルール (接頭辞・除外ワード・末尾の空白を除いた接尾辞) を 1 本の正規表現に
+_TITLE_DROP_RE = (
+    "^(?:" + "|".join(re.escape(p) for p in EXCLUDE_TITLE_PREFIXES) + ")"
+    + "|" + _EXCLUDE_WORDS_RE.pattern
+    + "|(?:" + "|".join(re.escape(s) for s in EXCLUDE_TITLE_SUFFIXES) + r")\s*\Z"
+)
+_TEXT_COLUMNS = ("title", "comment", "review", "image_large", "image_small")
+
+
+def _str_or_empty(value) -> str:
+    return value if isinstance(value, str) else ""
+
+
+def items_to_frame(items: list[dict]):
+    """ItemList のアイテムを filter_mask が使う列の DataFrame に正規化する。
+
+    genres は作品ごとのジャンル名のリスト、performers は出演者数。
+    """
+    import pandas as pd
+
+    infos = [item.get("iteminfo", {}) for item in items]
+    imgs = [item.get("imageURL") or {} for item in items]
+    df = pd.DataFrame({
+        "title": [str(item.get("title", "")) for item in items],
+        "genres": [[g.get("name", "") for g in info.get("genre", [])] for info in infos],
+        "performers": [len(info.get("actress", [])) for info in infos],
+        "comment": [_str_or_empty(info.get("comment", "")) for info in infos],
+        "review": [_str_or_empty(item.get("review", "") or "") for item in items],
+        "has_sample": [
+            bool(item.get("sampleMovieURL") or item.get("sampleImageURL"))
+            for item in items
+        ],
+        "image_large": [img.get("large") or "" for img in imgs],
+        "image_small": [img.get("small") or "" for img in imgs],
+    })
+    # 0 件でも .str が使えるよう文字列の列の型を揃える
+    return df.astype({c: str for c in _TEXT_COLUMNS})
+
+
+def filter_mask(df, *, require_sample_video: bool = False):
+    """items_to_frame の DataFrame から、filter_items で残る行を True にした
+    bool の Series (df と同じ index) を返す。件数上限 (max_items) はかけない。
+    """
+    drop = df["title"].str.contains(_TITLE_DROP_RE, regex=True)
+
+    # ジャンル: 1 行 1 ジャンルに展開して isin で判定し、該当した元の行を落とす
+    genres = df["genres"].explode()
+    drop |= df.index.isin(genres.index[genres.isin(EXCLUDE_GENRES)])
+
+    drop |= df["performers"] > MAX_PERFORMERS
+    drop |= df["comment"].str.contains(_DUPE_PATTERN.pattern, regex=False)
+    drop |= df["review"].str.contains(_DUPE_PATTERN.pattern, regex=False)
+    if require_sample_video:
+        drop |= ~df["has_sample"]
+
+    large, small = df["image_large"], df["image_small"]
+    drop |= (large == "") & (small == "")
+    drop |= large.str.contains(_PRINTING_MARK, regex=False)
+    drop |= small.str.contains(_PRINTING_MARK, regex=False)
+    return ~drop.astype(bool)
@@ -0,0 +1,360 @@
+"""
+http_cache.py − 永続 HTTP レスポンスキャッシュ
+===============================================
+DMM API / NHブログ RSS のレスポンスを SQLite に保存し、
+プロセス再起動や複数レプリカ間でも再利用する。
+
+- キーは正規化した URL + クエリ (認証情報は含めない)
+- ソース種別ごとの TTL
+- 合計サイズ上限を超えたら最終アクセスの古い順に削除 (LRU)
+- ETag / Last-Modified による条件付き GET (304 なら本文を再利用)
+- レスポンス本文とは別に、加工済みの小さな結果 (女優検索結果・顔画像 URL など)
+  を名前空間 + キーで保存する results テーブル。明示的に無効化でき、
+  期限切れの行は書き込みのたびに削除する
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+
+DEFAULT_PATH = os.environ.get(
+    "HTTP_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "http_cache.sqlite"),
+)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# ソース種別ごとの TTL (秒)
+DEFAULT_TTLS = {
+    "dmm_item": 600,
+    "dmm_actress": 24 * 3600,
+    "nh_rss": 3600,
+    # results テーブルの名前空間
+    "actress_search": 24 * 3600,
+    "nh_face_img": 7 * 24 * 3600,
+}
+FALLBACK_TTL = 600
+
+# キャッシュキーから除外するクエリパラメータ (認証情報)
+_SECRET_PARAMS = frozenset({"api_id", "affiliate_id"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    source        TEXT NOT NULL,
+    body          BLOB NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    fetched_at    REAL NOT NULL,
+    accessed_at   REAL NOT NULL,
+    size          INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_responses_source ON responses (source);
+CREATE TABLE IF NOT EXISTS results (
+    namespace TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    value     TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+
+def normalize_key(url: str, params: dict | None = None) -> str:
+    """URL とクエリを正規化したキャッシュキーを返す。
+
+    クエリはキー順にソートし、認証情報のパラメータは除外する。
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((str(k), str(v)) for k, v in params.items())
+    query = sorted((k, v) for k, v in query if k not in _SECRET_PARAMS)
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), "")
+    )
+
+
+class HttpCache:
+    """SQLite バックエンドの HTTP レスポンスキャッシュ。スレッド安全。"""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PATH,
+        *,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttls: dict[str, float] | None = None,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def ttl_for(self, source: str) -> float:
+        return self.ttls.get(source, FALLBACK_TTL)
+
+    # -----------------------------------------------------------------------
+    # 低レベル操作
+    # -----------------------------------------------------------------------
+    def lookup(self, key: str) -> dict | None:
+        """キャッシュエントリを返す (期限切れでも返す)。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, body, etag, last_modified, fetched_at, accessed_at"
+                " FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        source, body, etag, last_modified, fetched_at, accessed_at = row
+        return {
+            "source": source,
+            "body": bytes(body),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "accessed_at": accessed_at,
+        }
+
+    def is_fresh(self, entry: dict, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return now - entry["fetched_at"] < self.ttl_for(entry["source"])
+
+    def store(
+        self,
+        key: str,
+        source: str,
+        body: bytes,
+        *,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        accessed_at: float | None = None,
+    ) -> None:
+        """accessed_at を省略すると取得時刻と同じにする。"""
+        now = time.time()
+        accessed_at = now if accessed_at is None else accessed_at
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, source, body, etag, last_modified, fetched_at, accessed_at, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, body, etag, last_modified, now, accessed_at, len(body)),
+            )
+            self._evict_locked()
+
+    def touch(self, key: str, *, refreshed: bool = False, accessed: bool = True) -> None:
+        """最終アクセス時刻を更新する。refreshed=True なら取得時刻も更新。
+        accessed=False なら取得時刻だけを更新する。"""
+        now = time.time()
+        with self._lock, self._conn:
+            if not accessed:
+                self._conn.execute(
+                    "UPDATE responses SET fetched_at = ? WHERE key = ?", (now, key)
+                )
+            elif refreshed:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ?, fetched_at = ? WHERE key = ?",
+                    (now, now, key),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+
+    def invalidate(self, *, source: str | None = None, key: str | None = None) -> None:
+        """キー単位・ソース単位、または全件を削除する。"""
+        with self._lock, self._conn:
+            if key is not None:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            elif source is not None:
+                self._conn.execute("DELETE FROM responses WHERE source = ?", (source,))
+            else:
+                self._conn.execute("DELETE FROM responses")
+
+    def expiring(
+        self,
+        source: str,
+        *,
+        within: float,
+        accessed_since: float,
+        limit: int = 100,
+    ) -> list[str]:
+        """within 秒以内に期限切れになる (または切れている) キーを返す。
+
+        accessed_since 以降に読まれたものだけを対象に、最近読まれた順に返す。
+        キャッシュウォーマーが先回りして取り直す対象を選ぶのに使う。
+        """
+        threshold = time.time() - self.ttl_for(source) + within
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM responses"
+                " WHERE source = ? AND fetched_at < ? AND accessed_at >= ?"
+                " ORDER BY accessed_at DESC LIMIT ?",
+                (source, threshold, accessed_since, limit),
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def _evict_locked(self) -> None:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        )
+        victims = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    # -----------------------------------------------------------------------
+    # 加工済みの結果 (JSON)
+    # -----------------------------------------------------------------------
+    def get_value(self, namespace: str, key: str):
+        """TTL 内の値を返す。無い・期限切れなら None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM results WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl_for(namespace):
+            return None
+        return json.loads(row[0])
+
+    def put_value(self, namespace: str, key: str, value) -> None:
+        """JSON で表せる値を保存する。あわせて期限切れの値を削除する。"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (namespace, key, value, stored_at)"
+                " VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), now),
+            )
+            self._purge_values_locked(now)
+
+    def _purge_values_locked(self, now: float) -> None:
+        """TTL を過ぎた results の行を名前空間ごとに削除する。"""
+        namespaces = [
+            ns for (ns,) in self._conn.execute("SELECT DISTINCT namespace FROM results")
+        ]
+        self._conn.executemany(
+            "DELETE FROM results WHERE namespace = ? AND stored_at < ?",
+            [(ns, now - self.ttl_for(ns)) for ns in namespaces],
+        )
+
+    def invalidate_values(self, namespace: str, key: str | None = None) -> None:
+        """名前空間内の 1 キー、または名前空間ごと削除する。"""
+        with self._lock, self._conn:
+            if key is not None:
+                self._conn.execute(
+                    "DELETE FROM results WHERE namespace = ? AND key = ?", (namespace, key)
+                )
+            else:
+                self._conn.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+
+    # -----------------------------------------------------------------------
+    # HTTP
+    # -----------------------------------------------------------------------
+    def fetch(
+        self,
+        session,
+        url: str,
+        *,
+        source: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+        timeout: float = 15,
+        conditional: bool = False,
+        warm: bool = False,
+        throttle: Callable[[], None] | None = None,
+    ) -> bytes:
+        """キャッシュ経由で GET し、レスポンス本文を返す。
+
+        TTL 内のエントリがあれば通信しない。conditional=True の場合、
+        期限切れエントリの ETag / Last-Modified で条件付き GET を行う。
+        warm=True (キャッシュウォーマー用) は TTL 内でも取り直し、
+        最終アクセス時刻は変えない。throttle は実際に通信する直前にだけ
+        呼ばれる (レートリミッタのトークン取得など)。
+        """
+        key, entry, req_headers = self._prepare(url, params, headers, conditional, warm)
+        if req_headers is None:
+            return entry["body"]
+        if throttle is not None:
+            throttle()
+        resp = session.get(url, params=params, headers=req_headers, timeout=timeout)
+        return self._complete(key, source, entry, resp, warm)
+
+    async def afetch(
+        self,
+        client,
+        url: str,
+        *,
+        source: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+        timeout: float = 15,
+        conditional: bool = False,
+        throttle: Callable[[], None] | None = None,
+    ) -> bytes:
+        """fetch() の非同期版。client は httpx.AsyncClient を想定。
+
+        SQLite の読み書きと throttle (ブロッキングする関数) はワーカー
+        スレッドで実行し、イベントループを塞がない。timeout は通信全体に
+        かかり、throttle の待ち時間は含まない。
+        """
+        key, entry, req_headers = await asyncio.to_thread(
+            self._prepare, url, params, headers, conditional, False
+        )
+        if req_headers is None:
+            return entry["body"]
+        if throttle is not None:
+            await asyncio.to_thread(throttle)
+        resp = await asyncio.wait_for(
+            client.get(url, params=params, headers=req_headers, timeout=timeout),
+            timeout,
+        )
+        return await asyncio.to_thread(self._complete, key, source, entry, resp, False)
+
+    def _prepare(self, url, params, headers, conditional, warm):
+        """(key, entry, 送信ヘッダー) を返す。TTL 内ならヘッダーは None。"""
+        key = normalize_key(url, params)
+        entry = self.lookup(key)
+        if entry is not None and not warm and self.is_fresh(entry):
+            self.touch(key)
+            return key, entry, None
+
+        req_headers = dict(headers or {})
+        if conditional and entry is not None:
+            if entry["etag"]:
+                req_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                req_headers["If-Modified-Since"] = entry["last_modified"]
+        return key, entry, req_headers
+
+    def _complete(self, key, source, entry, resp, warm) -> bytes:
+        if resp.status_code == 304 and entry is not None:
+            self.touch(key, refreshed=True, accessed=not warm)
+            return entry["body"]
+        resp.raise_for_status()
+        body = resp.content
+        self.store(
+            key, source, body,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+            accessed_at=entry["accessed_at"] if warm and entry is not None else None,
+        )
+        return body
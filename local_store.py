@@ -0,0 +1,518 @@
+"""
+local_store.py − ローカル SQLite ストア + スプレッドシートへの write-behind 同期
+================================================================================
+fanza_db スプレッドシートの各タブをローカル SQLite に複製し、読み取りは
+すべてローカルから行う。書き込みはローカルに即時反映したうえで outbox に
+積み、SheetSync がバックグラウンドでスプレッドシートへ反映する。
+スプレッドシートはミラー (バックアップ) の位置付けになる。
+
+同期方式:
+  - actresses  : シートの現状との差分セルだけを 1 回の batch_update で反映
+                 (連続した変更は 1 回に集約。ヘッダーの並びもここで直す)
+  - sent_works / history : 追記 (連続した追記は 1 回の append_rows に集約)
+
+outbox は SQLite にコミットされる追記ジャーナルでもあるため、プロセスが
+途中で落ちても未送信分は次回の flush で再送される。
+
+sent_works / history の各行にはローカルだけの列 sent_at (記録した時刻) を
+持たせ、compact はこれと作品の日付の両方が古い行だけを消す。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+DEFAULT_PATH = os.environ.get(
+    "LOCAL_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fanza_db.sqlite"),
+)
+
+ACTRESS_COLUMNS = ["name", "actress_id", "image_url", "group", "source"]
+SENT_WORKS_COLUMNS = ["content_id", "title", "date", "actress_name"]
+HISTORY_COLUMNS = ["content_id", "title", "date"]
+
+# 追記型タブ -> 列
+APPEND_TABS = {
+    "sent_works": SENT_WORKS_COLUMNS,
+    "history": HISTORY_COLUMNS,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS actresses (
+    position   INTEGER NOT NULL,
+    name       TEXT NOT NULL DEFAULT '',
+    actress_id TEXT NOT NULL,
+    image_url  TEXT NOT NULL DEFAULT '',
+    "group"    TEXT NOT NULL DEFAULT '',
+    source     TEXT NOT NULL DEFAULT 'FANZA'
+);
+CREATE INDEX IF NOT EXISTS idx_actresses_id ON actresses (actress_id);
+CREATE INDEX IF NOT EXISTS idx_actresses_group ON actresses ("group");
+CREATE INDEX IF NOT EXISTS idx_actresses_position ON actresses (position);
+
+CREATE TABLE IF NOT EXISTS sent_works (
+    content_id   TEXT PRIMARY KEY,
+    title        TEXT NOT NULL DEFAULT '',
+    date         TEXT NOT NULL DEFAULT '',
+    actress_name TEXT NOT NULL DEFAULT '',
+    sent_at      REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sent_works_date ON sent_works (date);
+
+CREATE TABLE IF NOT EXISTS history (
+    content_id TEXT PRIMARY KEY,
+    title      TEXT NOT NULL DEFAULT '',
+    date       TEXT NOT NULL DEFAULT '',
+    sent_at    REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_history_date ON history (date);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    tab        TEXT NOT NULL,
+    op         TEXT NOT NULL,
+    payload    TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _col_letter(n: int) -> str:
+    """1 始まりの列番号を A1 記法の列名に変換する。"""
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+class CellBatch:
+    """セル単位の変更を集めて 1 回の batch_update で送る。
+
+    同じ行で隣り合うセルは 1 つの範囲に、同じ列範囲が連続する行は
+    さらに縦にまとめる。複数行にまたがる編集はすべてこれを経由させる。
+    """
+
+    def __init__(self):
+        self._cells: dict[tuple[int, int], str] = {}
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def set(self, row: int, col: int, value) -> None:
+        """1 始まりの (row, col) に value を書き込む予約をする。"""
+        self._cells[(row, col)] = "" if value is None else str(value)
+
+    def set_row(self, row: int, values: list, *, first_col: int = 1) -> None:
+        for offset, value in enumerate(values):
+            self.set(row, first_col + offset, value)
+
+    def to_updates(self) -> list[dict]:
+        # 1) 行ごとに連続する列をまとめる: (row, c1, c2, values)
+        runs: list[tuple[int, int, int, list[str]]] = []
+        for (row, col) in sorted(self._cells):
+            value = self._cells[(row, col)]
+            if runs and runs[-1][0] == row and runs[-1][2] == col - 1:
+                r, c1, _, vals = runs[-1]
+                runs[-1] = (r, c1, col, vals + [value])
+            else:
+                runs.append((row, col, col, [value]))
+        # 2) 同じ列範囲で行が連続するものを縦にまとめる
+        blocks: list[tuple[int, int, int, int, list[list[str]]]] = []
+        for row, c1, c2, vals in runs:
+            if blocks:
+                r1, r2, b1, b2, rows = blocks[-1]
+                if r2 == row - 1 and (b1, b2) == (c1, c2):
+                    blocks[-1] = (r1, row, b1, b2, rows + [vals])
+                    continue
+            blocks.append((row, row, c1, c2, [vals]))
+        return [
+            {
+                "range": f"{_col_letter(c1)}{r1}:{_col_letter(c2)}{r2}",
+                "values": rows,
+            }
+            for r1, r2, c1, c2, rows in blocks
+        ]
+
+    def apply(self, ws) -> None:
+        """予約した変更を 1 回の batch_update で送る。変更がなければ何もしない。"""
+        if self._cells:
+            ws.batch_update(self.to_updates())
+
+
+def diff_cells(
+    old: list[list[str]], new: list[list[str]], *, start_row: int = 2,
+    batch: CellBatch | None = None,
+) -> CellBatch:
+    """old から new への変更のうち、値が変わったセルだけを batch に積む。
+
+    new が短い場合、余った行は空文字で上書きして消す。
+    """
+    batch = batch if batch is not None else CellBatch()
+    width = max([len(r) for r in old + new] or [0])
+    for i in range(max(len(old), len(new))):
+        new_row = new[i] if i < len(new) else []
+        old_row = old[i] if i < len(old) else []
+        for j in range(width):
+            nv = str(new_row[j]) if j < len(new_row) else ""
+            ov = str(old_row[j]) if j < len(old_row) else ""
+            if nv != ov:
+                batch.set(start_row + i, j + 1, nv)
+    return batch
+
+
+def _actress_row(r: dict) -> list[str]:
+    """スプレッドシートのレコードを ACTRESS_COLUMNS 順の行に正規化する。"""
+    row = [str(r.get(c, "") if r.get(c) is not None else "") for c in ACTRESS_COLUMNS]
+    if not row[4]:
+        row[4] = "FANZA"
+    return row
+
+
+class LocalStore:
+    """fanza_db のローカル複製。スレッド安全。"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """sent_at 列が無い古いストアに列と索引を追加する。"""
+        with self._lock, self._conn:
+            for tab in APPEND_TABS:
+                cols = {r[1] for r in self._conn.execute(f"PRAGMA table_info({tab})")}
+                if "sent_at" not in cols:
+                    self._conn.execute(
+                        f"ALTER TABLE {tab} ADD COLUMN sent_at REAL NOT NULL DEFAULT 0"
+                    )
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{tab}_sent_at ON {tab} (sent_at)"
+                )
+
+    # -----------------------------------------------------------------------
+    # メタ情報 / 取り込み
+    # -----------------------------------------------------------------------
+    def hydrated_at(self, tab: str) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (f"hydrated:{tab}",)
+            ).fetchone()
+        return float(row[0]) if row else 0.0
+
+    def is_stale(self, tab: str, max_age: float) -> bool:
+        """max_age 秒以上取り込んでいなければ True。"""
+        return time.time() - self.hydrated_at(tab) >= max_age
+
+    def has_pending(self, tab: str | None = None) -> bool:
+        with self._lock:
+            if tab is None:
+                row = self._conn.execute("SELECT 1 FROM outbox LIMIT 1").fetchone()
+            else:
+                row = self._conn.execute(
+                    "SELECT 1 FROM outbox WHERE tab = ? LIMIT 1", (tab,)
+                ).fetchone()
+        return row is not None
+
+    def hydrate(self, tab: str, records: list[dict]) -> None:
+        """スプレッドシートの get_all_records() 結果でタブを置き換える。
+
+        シートには送信時刻が無いので、sent_at は既存行の値を引き継ぎ、
+        新しく入る行は取り込んだ時刻にする。
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            if tab == "actresses":
+                self._conn.execute("DELETE FROM actresses")
+                self._conn.executemany(
+                    "INSERT INTO actresses"
+                    ' (position, name, actress_id, image_url, "group", source)'
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [(i, *_actress_row(r)) for i, r in enumerate(records)],
+                )
+            else:
+                cols = APPEND_TABS[tab]
+                sent_at = dict(
+                    self._conn.execute(f"SELECT content_id, sent_at FROM {tab}")
+                )
+                self._conn.execute(f"DELETE FROM {tab}")
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {tab} ({', '.join(cols)}, sent_at)"
+                    f" VALUES ({', '.join('?' * len(cols))}, ?)",
+                    [
+                        [str(r.get(c, "")) for c in cols]
+                        + [sent_at.get(str(r.get("content_id", "")), now)]
+                        for r in records
+                    ],
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (f"hydrated:{tab}", str(time.time())),
+            )
+
+    def request_rewrite(self, tab: str) -> None:
+        """ローカルの内容でシートを書き直す予約をする (ヘッダーの修復など)。"""
+        with self._lock, self._conn:
+            self._enqueue_snapshot_locked(tab)
+
+    # -----------------------------------------------------------------------
+    # actresses
+    # -----------------------------------------------------------------------
+    def actresses(self) -> list[dict]:
+        """全女優を表示順で返す。"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, actress_id, image_url, "group", source'
+                " FROM actresses ORDER BY position"
+            ).fetchall()
+        return [dict(zip(ACTRESS_COLUMNS, r)) for r in rows]
+
+    def find_actress(self, actress_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT name, actress_id, image_url, "group", source'
+                " FROM actresses WHERE actress_id = ?",
+                (str(actress_id),),
+            ).fetchone()
+        return dict(zip(ACTRESS_COLUMNS, row)) if row else None
+
+    def actresses_in_group(self, group: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, actress_id, image_url, "group", source'
+                ' FROM actresses WHERE "group" = ? ORDER BY position',
+                (group,),
+            ).fetchall()
+        return [dict(zip(ACTRESS_COLUMNS, r)) for r in rows]
+
+    def replace_actresses(self, rows: list[list[str]]) -> None:
+        """女優タブ全体を rows (ACTRESS_COLUMNS 順) で置き換える。"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM actresses")
+            self._conn.executemany(
+                "INSERT INTO actresses"
+                ' (position, name, actress_id, image_url, "group", source)'
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (i, *_actress_row(dict(zip(ACTRESS_COLUMNS, r))))
+                    for i, r in enumerate(rows)
+                ],
+            )
+            self._enqueue_snapshot_locked("actresses")
+
+    def append_actresses(self, rows: list[list[str]]) -> None:
+        with self._lock:
+            current = [_actress_row(r) for r in self.actresses()]
+            self.replace_actresses(current + [list(r) for r in rows])
+
+    def delete_actress(self, actress_id: str) -> None:
+        """actress_id に一致する最初の 1 行を削除する。"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT rowid FROM actresses WHERE actress_id = ?"
+                " ORDER BY position LIMIT 1",
+                (str(actress_id),),
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute("DELETE FROM actresses WHERE rowid = ?", row)
+            self._enqueue_snapshot_locked("actresses")
+
+    def clear_group(self, group: str) -> None:
+        """group に属する女優を未分類に戻す。"""
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                'UPDATE actresses SET "group" = \'\' WHERE "group" = ?', (group,)
+            )
+            if cur.rowcount:
+                self._enqueue_snapshot_locked("actresses")
+
+    # -----------------------------------------------------------------------
+    # sent_works / history
+    # -----------------------------------------------------------------------
+    def known_content_ids(self, tab: str) -> set[str]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT content_id FROM {tab}").fetchall()
+        return {r[0] for r in rows}
+
+    def content_ids_since(self, tab: str, date: str, sent_since: float) -> list[str]:
+        """date (YYYY-MM-DD) 以降の作品か、sent_since (UNIX 時刻) 以降に
+        記録した行の content_id を返す。"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT content_id FROM {tab} WHERE date >= ? OR sent_at >= ?",
+                (date, sent_since),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def compact(self, tab: str, *, before_date: str, sent_before: float) -> int:
+        """作品の日付が before_date より古く、かつ sent_before (UNIX 時刻)
+        より前に記録した行をローカルから削除し、件数を返す。
+
+        記録時刻も見るので、DMM 側で発売日が変わった作品や予約作品の行を
+        窓内に送ったばかりのうちに消すことはない。
+        スプレッドシートへは反映しない (シート側は履歴として残す)。
+        """
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"DELETE FROM {tab} WHERE date < ? AND sent_at < ?",
+                (before_date, sent_before),
+            )
+        return cur.rowcount
+
+    def append_records(self, tab: str, rows: list[list[str]]) -> None:
+        """追記型タブに行を追加し、スプレッドシートへの追記を予約する。"""
+        if not rows:
+            return
+        cols = APPEND_TABS[tab]
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {tab} ({', '.join(cols)}, sent_at)"
+                f" VALUES ({', '.join('?' * len(cols))}, ?)",
+                [[str(v) for v in r] + [now] for r in rows],
+            )
+            self._enqueue_locked(tab, "append_rows", [[str(v) for v in r] for r in rows])
+
+    # -----------------------------------------------------------------------
+    # outbox
+    # -----------------------------------------------------------------------
+    def _enqueue_locked(self, tab: str, op: str, payload) -> None:
+        self._conn.execute(
+            "INSERT INTO outbox (tab, op, payload, created_at) VALUES (?, ?, ?, ?)",
+            (tab, op, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+
+    def _enqueue_snapshot_locked(self, tab: str) -> None:
+        # スナップショットは同期時点の最新状態を書くので、未送信の分は 1 件に集約
+        self._conn.execute(
+            "DELETE FROM outbox WHERE tab = ? AND op = 'snapshot'", (tab,)
+        )
+        self._enqueue_locked(tab, "snapshot", None)
+
+    def pending_ops(self) -> list[tuple[int, str, str, object]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, tab, op, payload FROM outbox ORDER BY id"
+            ).fetchall()
+        return [(i, tab, op, json.loads(p)) for i, tab, op, p in rows]
+
+    def ack(self, *op_ids: int) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM outbox WHERE id = ?", [(i,) for i in op_ids]
+            )
+
+
+class SheetSync:
+    """LocalStore の outbox をスプレッドシートへ反映する write-behind 同期。
+
+    get_worksheet はタブ名からワークシートを返す関数。tabs を指定すると
+    そのタブの操作だけを扱う。start() でバックグラウンドスレッドを起動し、
+    flush() で即時に反映する。
+    """
+
+    def __init__(
+        self,
+        store: LocalStore,
+        get_worksheet: Callable[[str], object],
+        *,
+        tabs: tuple[str, ...] | None = None,
+        interval: float = 5.0,
+    ):
+        self.store = store
+        self.get_worksheet = get_worksheet
+        self.tabs = tabs
+        self.interval = interval
+        self.last_error: Exception | None = None
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "SheetSync":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="sheet-sync", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def notify(self) -> None:
+        """変更があったことをバックグラウンドスレッドに知らせる。"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.last_error = e
+
+    def flush(self) -> int:
+        """未送信の操作をすべて反映し、反映した操作の件数を返す。
+
+        同じタブへの連続した追記は 1 回の append_rows にまとめる。
+        失敗した操作は outbox に残り、次回の flush で再送される。
+        """
+        done = 0
+        with self._flush_lock:
+            ops = [
+                op for op in self.store.pending_ops()
+                if self.tabs is None or op[1] in self.tabs
+            ]
+            i = 0
+            while i < len(ops):
+                op_id, tab, op, payload = ops[i]
+                ws = self.get_worksheet(tab)
+                if op == "append_rows":
+                    op_ids, rows = [op_id], list(payload)
+                    i += 1
+                    while i < len(ops) and ops[i][1] == tab and ops[i][2] == "append_rows":
+                        op_ids.append(ops[i][0])
+                        rows.extend(ops[i][3])
+                        i += 1
+                    ws.append_rows(rows)
+                else:
+                    op_ids = [op_id]
+                    i += 1
+                    if op == "snapshot":
+                        self._write_actresses(ws)
+                self.store.ack(*op_ids)
+                done += len(op_ids)
+        self.last_error = None
+        return done
+
+    def _write_actresses(self, ws) -> None:
+        """シートの現状との差分セルだけを 1 回の batch_update で書き込む。
+
+        差分は毎回 get_all_values() で読んだシートに対して取るので、手作業の
+        編集や別プロセスの書き込みがあっても列・行がずれない。ヘッダーが
+        ACTRESS_COLUMNS と違えば同じ batch_update で書き直し、余分な列は
+        空文字で消す。clear → append の 2 段階書き込みと違い、途中で
+        失敗してもシートが空になることはない。
+        """
+        rows = [
+            [r[c] for c in ACTRESS_COLUMNS] for r in self.store.actresses()
+        ]
+        values = ws.get_all_values()
+        header = values[0] if values else []
+        width = max([len(r) for r in values] + [len(ACTRESS_COLUMNS)])
+        batch = CellBatch()
+        if header != ACTRESS_COLUMNS:
+            batch.set_row(1, ACTRESS_COLUMNS + [""] * (width - len(ACTRESS_COLUMNS)))
+        diff_cells(values[1:], rows, batch=batch).apply(ws)
@@ -0,0 +1,410 @@
+"""
+nh_blog.py − NHブログ (RSS / カテゴリページ) アクセス
+======================================================
+app.py から切り出した NHブログの検索・顔画像取得・カテゴリ RSS 取得。
+
+- RSS の取得は永続 HTTP キャッシュ経由 (期限切れ時は条件付き GET)、
+  顔画像はページではなく抽出した URL だけを保存する
+- ダッシュボード用に、複数カテゴリ RSS を asyncio + httpx で並行取得する
+  category_items_many() を持つ。フィードごとのタイムアウトと同時接続数の
+  上限があり、遅いフィードが 1 本あっても他の結果は待たされない
+- 並行取得でも、実際に通信するフィード 1 本ごとにレートリミッタの
+  トークンを取る (キャッシュで済んだフィードは取らない)
+- RSS のパース・キャッシュの読み書き・トークン待ちはイベントループを
+  塞がないようワーカースレッドで行う
+- カテゴリ RSS は先頭 max_items 件だけをストリーミングで読む
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import io
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from xml.etree import ElementTree
+
+import feedparser
+import httpx
+import requests
+
+from fetch_pool import HostRateLimiter
+from http_cache import HttpCache, normalize_key
+
+NH_BLOG_BASE = "https://main.av-somurie.xyz"
+NH_BLOG_HOST = urllib.parse.urlparse(NH_BLOG_BASE).netloc
+NH_BLOG_SEARCH_URL = NH_BLOG_BASE + "/?s={query}&feed=rss2"
+NH_BLOG_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
+
+RSS_TIMEOUT = 30
+# カテゴリページ (顔画像取得用)。結果は保存するので長く待つ必要はない
+HTML_TIMEOUT = 20
+# 並行取得時の 1 フィードあたりのタイムアウト (秒) と同時接続数
+DEFAULT_FEED_TIMEOUT = 15
+DEFAULT_CONCURRENCY = 8
+PARSE_WORKERS = 4
+# パース結果メモの上限 (超えたら丸ごと捨てる)
+MAX_PARSED_MEMO = 4096
+
+_CONTENT_ENCODED = "{http://purl.org/rss/1.0/modules/content/}encoded"
+
+# ---------------------------------------------------------------------------
+# 正規表現 (モジュール読み込み時に 1 回だけコンパイル)
+# ---------------------------------------------------------------------------
+_IMG_SRC_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\']')
+# パッケージ画像 (pl.jpg / top.jpg など)
+_PACKAGE_IMG_RE = re.compile(r'(?:pl|top)\.(?:jpg|jpeg|png|webp)', re.IGNORECASE)
+# サンプル画像 (jp-X.jpg, -X.jpg, _X.jpg) とバナー画像
+_SAMPLE_OR_BANNER_RE = re.compile(
+    r'(?:jp-\d+|-\d+|_\d+)\.(?:jpg|jpeg|png|webp)|bannar', re.IGNORECASE
+)
+# 記事リンク → カテゴリパス
+# 例: https://main.av-somurie.xyz/tagyou/takanashi_kanon/post-57648/
+_POST_LINK_RE = re.compile(r"https?://main\.av-somurie\.xyz/([\w]+/[\w]+)/post-\d+/?")
+_PROFILE_ARTICLE_RE = re.compile(
+    r'<article[^>]*class=["\'][^"\']*category-content[^"\']*["\'][^>]*>(.*?)</article>',
+    re.DOTALL,
+)
+
+
+# ---------------------------------------------------------------------------
+# カテゴリ RSS のパース
+# ---------------------------------------------------------------------------
+def category_rss_url(category_path: str) -> str:
+    return f"{NH_BLOG_BASE}/category/{category_path}/?feed=rss2"
+
+
+def _format_published(pub_date: str) -> str:
+    """RFC 822 の pubDate を UTC の YYYY-MM-DD HH:MM:SS に揃える。
+    feedparser の published_parsed + time.strftime と同じ結果になる。
+    解釈できなければ元の文字列を返す。"""
+    try:
+        dt = email.utils.parsedate_to_datetime(pub_date)
+    except (TypeError, ValueError, IndexError):
+        return pub_date
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _pick_thumbnail(content: str) -> str:
+    """本文 HTML からサムネイルに使う画像 URL を選ぶ。
+
+    優先順位は
+      1. pl.(jpg|webp|png) や top.jpg (パッケージ画像) の最初の 1 枚
+      2. サンプル画像 (jp-X.jpg, -X.jpg, _X.jpg) とバナー画像以外の最初の 1 枚
+      3. 最初の画像
+    で、画像を 1 回ずつ評価する 1 パスで決める。1 が見つかれば打ち切る。"""
+    first = ""
+    non_sample = ""
+    for m in _IMG_SRC_RE.finditer(content):
+        img = m.group(1)
+        if _PACKAGE_IMG_RE.search(img):
+            return img
+        if not first:
+            first = img
+        if not non_sample and not _SAMPLE_OR_BANNER_RE.search(img):
+            non_sample = img
+    return non_sample or first
+
+
+def parse_category_feed(body: bytes, max_items: int = 5) -> list[dict]:
+    """カテゴリ RSS 本文から最新作品を取り出す。
+    戻り値: [{title, link, thumbnail, published}]
+
+    iterparse で <item> を先頭から読み、max_items 件に達した時点で打ち切る。
+    読み終えた <item> は都度破棄するので、処理量はフィード全体ではなく
+    max_items に比例する。XML として壊れている場合だけ寛容な
+    feedparser で読み直す。"""
+    works = []
+    if max_items <= 0:
+        return works
+    seen = 0
+    try:
+        for _event, elem in ElementTree.iterparse(io.BytesIO(body), events=("end",)):
+            if elem.tag != "item":
+                continue
+            seen += 1
+            title = (elem.findtext("title") or "").strip()
+            if title:
+                content = (elem.findtext(_CONTENT_ENCODED) or "").strip()
+                if not content:
+                    content = (elem.findtext("description") or "").strip()
+                works.append({
+                    "title": title,
+                    "link": (elem.findtext("link") or "").strip(),
+                    "thumbnail": _pick_thumbnail(content),
+                    "published": _format_published((elem.findtext("pubDate") or "").strip()),
+                })
+            elem.clear()
+            if seen >= max_items:
+                break
+    except ElementTree.ParseError:
+        return _parse_category_feed_lenient(body, max_items)
+    return works
+
+
+def _parse_category_feed_lenient(body: bytes, max_items: int) -> list[dict]:
+    """feedparser による従来のパース (壊れた XML 向けのフォールバック)。"""
+    feed = feedparser.parse(body)
+    works = []
+    for entry in feed.entries[:max_items]:
+        title = entry.get("title", "")
+        link = entry.get("link", "")
+
+        # 投稿日時を FANZA と同じ YYYY-MM-DD HH:MM:SS 形式に揃える
+        published_parsed = entry.get("published_parsed")
+        if published_parsed:
+            published = time.strftime('%Y-%m-%d %H:%M:%S', published_parsed)
+        else:
+            published = entry.get("published", "")
+
+        # content:encoded や summary から画像を抽出
+        content = ""
+        if "content" in entry and entry.content:
+            content = entry.content[0].get("value", "")
+        if not content:
+            content = entry.get("summary", "")
+
+        if title:
+            works.append({
+                "title": title,
+                "link": link,
+                "thumbnail": _pick_thumbnail(content),
+                "published": published,
+            })
+    return works
+
+
+# ---------------------------------------------------------------------------
+# 検索結果からのカテゴリ推定
+# ---------------------------------------------------------------------------
+def infer_category(entries) -> dict:
+    """検索 RSS のエントリから女優のカテゴリパスと記事一覧を求める。
+
+    記事リンクからカテゴリパスを逆算し、
+    (例: https://main.av-somurie.xyz/tagyou/takanashi_kanon/post-57648/
+      → category_path = "tagyou/takanashi_kanon")
+    出現回数が最も多いパスを女優の専用カテゴリと見なす (同数なら先に出た方)。
+    共演記事など別カテゴリの記事は除外する。
+
+    エントリを 1 回だけ走査し、パスごとの件数と記事リストを同時に集める。
+    /actress_search/ は女優一覧ページなので件数には数えない。"""
+    path_counts: dict[str, int] = {}
+    path_articles: dict[str, list[dict]] = {}
+    for entry in entries:
+        link = entry.get("link", "")
+        m = _POST_LINK_RE.match(link)
+        if not m:
+            continue
+        path = m.group(1)
+        path_articles.setdefault(path, []).append({
+            "title": entry.get("title", ""),
+            "link": link,
+            "published": entry.get("published", ""),
+        })
+        if "/actress_search/" not in link:
+            path_counts[path] = path_counts.get(path, 0) + 1
+
+    if not path_counts:
+        return {"category_path": "", "articles": [], "count": 0}
+    best_path = max(path_counts, key=path_counts.get)
+    articles = path_articles[best_path]
+    return {
+        "category_path": best_path,
+        "articles": articles,
+        "count": len(articles),
+    }
+
+
+class NhBlog:
+    """NHブログへのアクセスをまとめたクライアント。スレッド安全。"""
+
+    def __init__(
+        self,
+        cache: HttpCache | None = None,
+        *,
+        feed_timeout: float = DEFAULT_FEED_TIMEOUT,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        limiter: HostRateLimiter | None = None,
+    ):
+        self.cache = cache
+        self.limiter = limiter
+        self.feed_timeout = feed_timeout
+        self.concurrency = concurrency
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = NH_BLOG_UA
+        self._parse_pool = ThreadPoolExecutor(
+            max_workers=PARSE_WORKERS, thread_name_prefix="nh-parse"
+        )
+        # (category_path, max_items) -> (本文ダイジェスト, パース結果)
+        self._parsed: dict[tuple[str, int], tuple[bytes, list[dict]]] = {}
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------
+    # 同期 API
+    # -----------------------------------------------------------------------
+    def _get(self, url: str, *, source: str | None, timeout: float) -> bytes:
+        """source が None ならレスポンス本文はキャッシュしない。"""
+        if self.cache is None or source is None:
+            self._throttle()
+            resp = self.session.get(url, timeout=timeout)
+            resp.raise_for_status()
+            return resp.content
+        return self.cache.fetch(
+            self.session, url, source=source, timeout=timeout, conditional=True,
+            throttle=self._throttle,
+        )
+
+    def _throttle(self) -> None:
+        """limiter があれば、実際に通信する直前に NH_BLOG_HOST のトークンを取る。"""
+        if self.limiter is not None:
+            self.limiter.acquire(NH_BLOG_HOST)
+
+    def warm(self, key: str) -> None:
+        """キャッシュ済みの RSS (キーは正規化 URL) を条件付き GET で取り直す。
+        cache がなければ何もしない。"""
+        if self.cache is None:
+            return
+        self.cache.fetch(
+            self.session, key, source="nh_rss", timeout=RSS_TIMEOUT,
+            conditional=True, warm=True, throttle=self._throttle,
+        )
+
+    def fetch_rss(self, url: str) -> feedparser.FeedParserDict:
+        """User-Agent 付きで RSS を取得し feedparser でパースして返す。
+        永続キャッシュ経由で、期限切れ時は ETag / Last-Modified で条件付き GET。"""
+        return feedparser.parse(self._get(url, source="nh_rss", timeout=RSS_TIMEOUT))
+
+    def search(self, actress_name: str, *, refresh: bool = False) -> dict:
+        """NHブログを検索し、女優のカテゴリパス・記事数を返す。
+        戻り値: {category_path, articles: [{title, link, published}], count}
+        category_path が空の場合は該当なし。
+        refresh=True ならキャッシュ済みの検索 RSS を捨てて取り直す。"""
+        url = NH_BLOG_SEARCH_URL.format(query=urllib.parse.quote(actress_name))
+        if refresh and self.cache is not None:
+            self.cache.invalidate(key=normalize_key(url))
+        return infer_category(self.fetch_rss(url).entries)
+
+    def scrape_face_img(self, category_path: str, *, refresh: bool = False) -> str:
+        """カテゴリページHTMLから顔画像URLのみを取得する。
+
+        cache があれば URL (見つからなかった場合の空文字も) を名前空間
+        "nh_face_img" に保存し、ページ HTML 自体は保存しない。
+        refresh=True で保存済みの URL を捨てて取り直す。"""
+        if self.cache is not None:
+            if refresh:
+                self.cache.invalidate_values("nh_face_img", category_path)
+            else:
+                cached = self.cache.get_value("nh_face_img", category_path)
+                if cached is not None:
+                    return cached
+        cat_url = f"{NH_BLOG_BASE}/category/{category_path}/"
+        html = self._get(cat_url, source=None, timeout=HTML_TIMEOUT).decode(
+            "utf-8", errors="replace"
+        )
+        face_img = ""
+        profile_m = _PROFILE_ARTICLE_RE.search(html)
+        if profile_m:
+            img_m = _IMG_SRC_RE.search(profile_m.group(1))
+            if img_m:
+                face_img = img_m.group(1)
+        # 見つからなかった場合は保存しない (次回また探す)
+        if self.cache is not None and face_img:
+            self.cache.put_value("nh_face_img", category_path, face_img)
+        return face_img
+
+    def category_items(self, category_path: str, max_items: int = 5) -> list[dict]:
+        """カテゴリ RSS から最新作品を取得する（軽量・高速）。
+        戻り値: [{title, link, thumbnail, published}]"""
+        body = self._get(
+            category_rss_url(category_path), source="nh_rss", timeout=RSS_TIMEOUT,
+        )
+        return self._parse_memo(category_path, max_items, body)
+
+    def _parse_memo(self, category_path: str, max_items: int, body: bytes) -> list[dict]:
+        """本文が前回と同じならパースを省略する。"""
+        memo_key = (category_path, max_items)
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        with self._lock:
+            hit = self._parsed.get(memo_key)
+        if hit is not None and hit[0] == digest:
+            return hit[1]
+        works = parse_category_feed(body, max_items)
+        with self._lock:
+            if len(self._parsed) >= MAX_PARSED_MEMO:
+                self._parsed.clear()
+            self._parsed[memo_key] = (digest, works)
+        return works
+
+    # -----------------------------------------------------------------------
+    # 非同期 API (ダッシュボード用)
+    # -----------------------------------------------------------------------
+    async def _fetch_feed_async(
+        self, client: httpx.AsyncClient, url: str, timeout: float
+    ) -> bytes:
+        """timeout は通信だけにかかり、レートリミッタの待ち時間は含まない。"""
+        if self.cache is None:
+            await asyncio.to_thread(self._throttle)
+            resp = await asyncio.wait_for(client.get(url, timeout=timeout), timeout)
+            resp.raise_for_status()
+            return resp.content
+        return await self.cache.afetch(
+            client, url, source="nh_rss", timeout=timeout, conditional=True,
+            throttle=self._throttle,
+        )
+
+    async def category_items_many_async(
+        self,
+        category_paths,
+        max_items: int = 5,
+        *,
+        feed_timeout: float | None = None,
+        concurrency: int | None = None,
+    ) -> tuple[dict[str, list[dict]], dict[str, BaseException]]:
+        """複数カテゴリの RSS を並行取得・パースする。
+
+        戻り値は (category_path -> 作品リスト, category_path -> 例外)。
+        1 フィードの失敗・タイムアウトは errors に入るだけで他には影響しない。
+        """
+        paths = list(dict.fromkeys(category_paths))
+        feed_timeout = self.feed_timeout if feed_timeout is None else feed_timeout
+        sem = asyncio.Semaphore(concurrency or self.concurrency)
+        loop = asyncio.get_running_loop()
+        results: dict[str, list[dict]] = {}
+        errors: dict[str, BaseException] = {}
+
+        async def _one(client: httpx.AsyncClient, path: str) -> None:
+            try:
+                async with sem:
+                    body = await self._fetch_feed_async(
+                        client, category_rss_url(path), feed_timeout
+                    )
+                results[path] = await loop.run_in_executor(
+                    self._parse_pool, self._parse_memo, path, max_items, body,
+                )
+            except Exception as e:
+                errors[path] = e
+
+        limits = httpx.Limits(max_connections=concurrency or self.concurrency)
+        async with httpx.AsyncClient(
+            headers={"User-Agent": NH_BLOG_UA}, limits=limits, follow_redirects=True,
+        ) as client:
+            await asyncio.gather(*(_one(client, p) for p in paths))
+        return results, errors
+
+    def category_items_many(
+        self, category_paths, max_items: int = 5, **kwargs
+    ) -> tuple[dict[str, list[dict]], dict[str, BaseException]]:
+        """category_items_many_async() を新しいイベントループで実行する同期版。
+        Streamlit のスクリプトスレッドやワーカースレッドから呼ぶ。"""
+        return asyncio.run(
+            self.category_items_many_async(category_paths, max_items, **kwargs)
+        )
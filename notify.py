@@ -16,9 +16,12 @@ import os
 import sys
 import json
 import time
-import requests
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
+from dmm_client import DmmClient
+from discord_delivery import DiscordQueue
+from http_cache import HttpCache
+from local_store import LocalStore, SheetSync
 
 # ---------------------------------------------------------------------------
 # 設定読み込み
@@ -123,70 +126,21 @@ def get_sheet(client, tab_name: str):
 # ---------------------------------------------------------------------------
 # DMM API
 # ---------------------------------------------------------------------------
-DMM_ITEM_ENDPOINT = "https://api.dmm.com/affiliate/v3/ItemList"
+dmm = DmmClient(API_ID, AFFILIATE_ID, cache=HttpCache())
 
 
 def search_items_by_actress(actress_id: str, hits: int = 30):
     """指定女優 ID の新着作品を取得。"""
-    params = {
-        "api_id": API_ID,
-        "affiliate_id": AFFILIATE_ID,
-        "site": "FANZA",
-        "service": "digital",
-        "floor": "videoa",
-        "article": "actress",
-        "article_id": actress_id,
-        "hits": hits,
-        "sort": "date",
-        "output": "json",
-    }
-    resp = requests.get(DMM_ITEM_ENDPOINT, params=params, timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
-    result = data.get("result", {})
-    return result.get("items", [])
+    return dmm.search_items_by_actress(
+        actress_id, hits=hits, service="digital", floor="videoa"
+    )
 
 
 # ---------------------------------------------------------------------------
 # Discord 通知
 # ---------------------------------------------------------------------------
-def send_discord_notification(actress_name: str, items: list[dict]):
-    """Discord Webhook でまとめて通知。"""
-    if not items:
-        return
-
-    embeds = []
-    for item in items[:10]:  # Discord embed は 10 個まで
-        title = item.get("title", "タイトル不明")
-        url = item.get("affiliateURL") or item.get("URL", "")
-        date = item.get("date", "")[:10]
-        img_url = (
-            item.get("imageURL", {}).get("large", "")
-            or item.get("imageURL", {}).get("small", "")
-        )
-        embed = {
-            "title": title,
-            "url": url,
-            "color": 0xFF6699,
-            "fields": [{"name": "発売日", "value": date, "inline": True}],
-        }
-        if img_url:
-            embed["thumbnail"] = {"url": img_url}
-        embeds.append(embed)
-
-    payload = {
-        "content": f"🎬 **{actress_name}** の新作が {len(items)} 件見つかりました！",
-        "embeds": embeds,
-    }
-
-    resp = requests.post(
-        DISCORD_WEBHOOK_URL,
-        json=payload,
-        headers={"Content-Type": "application/json"},
-        timeout=15,
-    )
-    if resp.status_code not in (200, 204):
-        print(f"[WARN] Discord通知失敗 (status={resp.status_code}): {resp.text}")
+def item_url(item: dict) -> str:
+    return item.get("affiliateURL") or item.get("URL", "")
 
 
 # ---------------------------------------------------------------------------
@@ -205,11 +159,19 @@ def main():
         return
 
     # 既知の content_id を取得
+    # history はローカルストアから読み、シートへは write-behind
     ws_history = get_sheet(client, "history")
-    history_records = ws_history.get_all_records()
-    known_ids = {str(r.get("content_id", "")) for r in history_records}
-
+    store = LocalStore()
+    sync = SheetSync(store, lambda tab: ws_history, tabs=("history",))
+    sync.flush()  # 前回の実行で未送信のまま終わった分を先に反映
+    if os.environ.get("STORE_REHYDRATE") == "1" or not store.hydrated_at("history"):
+        store.hydrate("history", ws_history.get_all_records())
+    known_ids = store.known_content_ids("history")
+
+    discord = DiscordQueue(DISCORD_WEBHOOK_URL)
     total_new = 0
+    # 通知予定の history 行 (content_id -> 行)
+    pending_rows: dict[str, list[str]] = {}
 
     for act in actresses:
         name = act.get("name", "不明")
@@ -238,24 +200,35 @@ def main():
         print(f"    → 新作 {len(new_items)} 件検出！ Discord へ通知します。")
         total_new += len(new_items)
 
-        # Discord 通知
-        send_discord_notification(name, new_items)
-
-        # history に記録
-        rows_to_add = []
+        # history への記録は、その作品を含むメッセージを送れた直後に行う
         for item in new_items:
             cid = str(item.get("content_id", ""))
             title = item.get("title", "")
             date = item.get("date", "")[:10]
-            rows_to_add.append([cid, title, date])
+            pending_rows[cid] = [cid, title, date]
             known_ids.add(cid)
 
-        if rows_to_add:
-            ws_history.append_rows(rows_to_add)
+        # Discord 通知 (実行の最後にまとめて送信)
+        discord.add(name, new_items, item_url)
 
         # API レートリミット対策
         time.sleep(1)
 
+    # メッセージごとにローカルの outbox へ記録する (途中で落ちても二重通知しない)。
+    # 送れなかった作品は記録せず、次回の実行で改めて通知する
+    sent, undelivered = discord.flush(
+        on_sent=lambda cids: store.append_records(
+            "history", [pending_rows[c] for c in cids if c in pending_rows]
+        )
+    )
+    print(f"  Discord へ {sent} 件のメッセージを送信しました。")
+    failed_ids = {cid for _, content_ids in undelivered for cid in content_ids}
+    if undelivered:
+        print(
+            f"  [WARN] {len(undelivered)} 件のメッセージ ({len(failed_ids)} 作品) を"
+            " 送信できませんでした。次回再送します。"
+        )
+    sync.flush()
     print(f"=== 完了: 新作合計 {total_new} 件 ===")
 
 
@@ -0,0 +1,51 @@
+"""
+seen_index.py − 通知済み content_id の索引
+===========================================
+sent_works / history の重複判定用。通知対象になりうる期間 (カットオフ日
+以降) の ID だけをソート済みリストで保持し、bisect で判定する。
+ID 文字列は intern して同じ ID の重複オブジェクトを持たない。
+
+索引とローカルストアから外すのは、作品の日付と記録 (送信) 時刻の両方が
+カットオフより古い ID だけ。発売日が後から変わった作品や、発売前に送った
+予約作品を再通知しないよう、日付だけでは判断しない。
+"""
+
+import sys
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Iterable
+
+
+class SeenIndex:
+    """ソート済み ID 配列による集合。所属判定は O(log n)。"""
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids: Iterable[str] = ()):
+        self._ids: list[str] = sorted({sys.intern(str(i)) for i in ids if i})
+
+    def __contains__(self, content_id: object) -> bool:
+        if not isinstance(content_id, str):
+            content_id = str(content_id)
+        i = bisect_left(self._ids, content_id)
+        return i < len(self._ids) and self._ids[i] == content_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, content_id: str) -> None:
+        content_id = str(content_id)
+        if content_id and content_id not in self:
+            insort(self._ids, sys.intern(content_id))
+
+
+def load_seen_index(store, tab: str, cutoff_date: str) -> SeenIndex:
+    """ローカルストアの tab から、作品の日付か記録時刻が cutoff_date 以降の
+    ID で索引を作る。
+
+    あわせて両方とも cutoff_date より古い行をローカルストアから削除する
+    (スプレッドシート側には残る)。
+    """
+    cutoff_ts = datetime.strptime(cutoff_date[:10], "%Y-%m-%d").timestamp()
+    store.compact(tab, before_date=cutoff_date, sent_before=cutoff_ts)
+    return SeenIndex(store.content_ids_since(tab, cutoff_date, cutoff_ts))